@@ -0,0 +1,317 @@
+"""
+Offline Benchmark Suite
+Measures the report pipeline and command handler against local stub servers
+
+Runs scripted scenarios against stub_servers.py instead of the paid services
+and reports throughput, p50/p95/p99 latency and bytes transferred, so hot
+path regressions show up before they reach production:
+
+    single-report   generate one report and deliver it to TELEGRAM_CHAT_ID
+    broadcast       deliver a prepared report to --groups subscribed groups
+    retry-storm     broadcast while Telegram answers with 429s and 5xx errors
+    commands        push --commands updates through the command handler
+
+Usage:
+    python benchmark.py                       # all scenarios
+    python benchmark.py broadcast --groups 2000 --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from image_buffer import ImageBuffer
+from stub_servers import FaultProfile, StubServers
+
+SCENARIOS = ('single-report', 'broadcast', 'retry-storm', 'commands')
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (0 if empty)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def timed(func, samples):
+    """Wrap func so every call appends its duration (seconds) to samples"""
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - started)
+    return wrapper
+
+
+def summarize(name, samples, wall, stubs, **extra):
+    """Build the result record for one scenario"""
+    stats = stubs.stats_dict()
+    result = {
+        'scenario': name,
+        'operations': len(samples),
+        'wall_seconds': round(wall, 3),
+        'throughput_per_s': round(len(samples) / wall, 1) if wall > 0 else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(samples, 50) * 1000, 1),
+            'p95': round(percentile(samples, 95) * 1000, 1),
+            'p99': round(percentile(samples, 99) * 1000, 1),
+            'max': round(max(samples) * 1000, 1) if samples else 0.0,
+        },
+        'bytes_sent': sum(service['bytes_in'] for service in stats.values()),
+        'bytes_received': sum(service['bytes_out'] for service in stats.values()),
+        'services': stats,
+    }
+    result.update(extra)
+    return result
+
+
+def prepared_report(stubs):
+    """A report dict like bot.generate_report() returns, built from the stub content"""
+    return {
+        'content': stubs.report_text,
+        'image_url': stubs.env()['IMAGE_API_URL'] + "benchmark",
+        'image': ImageBuffer.from_bytes(stubs.image_bytes),
+    }
+
+
+def subscribe_groups(count):
+    """Replace the subscription store with count synthetic groups"""
+    import group_manager
+
+    for path in (group_manager.GROUPS_FILE, group_manager.GROUPS_LOG_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+    group_manager.save_groups([str(-1000000000000 - i) for i in range(count)])
+    group_manager.reload_groups()
+
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+
+def run_single_report(stubs, args):
+    """Full pipeline (news, image, delivery) to TELEGRAM_CHAT_ID only"""
+    import bot
+    import deadline
+    import delivery_ledger
+
+    subscribe_groups(0)
+    stubs.profiles['perplexity'] = FaultProfile(latency=args.perplexity_latency_ms / 1000.0, jitter=0.2)
+    stubs.profiles['image'] = FaultProfile(latency=args.image_latency_ms / 1000.0, jitter=0.2)
+    stubs.profiles['telegram'] = FaultProfile(latency=args.telegram_latency_ms / 1000.0, jitter=0.2)
+    stubs.reset_stats()
+
+    samples = []
+    started = time.perf_counter()
+    for iteration in range(args.iterations):
+        run_started = time.perf_counter()
+        run_budget = deadline.run_deadline()
+        report = bot.generate_report(run_budget)
+        if report:
+            ledger = delivery_ledger.DeliveryLedger(suffix=f".bench-single-{iteration}")
+            bot.deliver_to_all(report, run_budget, ledger)
+        samples.append(time.perf_counter() - run_started)
+
+    return summarize('single-report', samples, time.perf_counter() - started, stubs)
+
+
+def run_broadcast(stubs, args, name='broadcast', groups=None, telegram=None):
+    """Deliver a prepared report to many groups; latency is per chat"""
+    import bot
+    import deadline
+    import delivery_ledger
+
+    groups = args.groups if groups is None else groups
+    subscribe_groups(groups)
+    stubs.profiles['telegram'] = telegram or FaultProfile(latency=args.telegram_latency_ms / 1000.0, jitter=0.2)
+    stubs.reset_stats()
+
+    samples = []
+    original = bot.deliver_report
+    bot.deliver_report = timed(original, samples)
+    try:
+        ledger = delivery_ledger.DeliveryLedger(suffix=f".bench-{name}")
+        started = time.perf_counter()
+        bot.deliver_to_all(prepared_report(stubs), deadline.run_deadline(), ledger)
+        wall = time.perf_counter() - started
+    finally:
+        bot.deliver_report = original
+
+    summary = ledger.summary()
+    return summarize(name, samples, wall, stubs, delivered=summary['delivered'], failed=summary['failed'])
+
+
+def run_retry_storm(stubs, args):
+    """Broadcast while Telegram rejects a share of requests with 429 and 5xx"""
+    telegram = FaultProfile(
+        latency=args.telegram_latency_ms / 1000.0,
+        jitter=0.2,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+    )
+    return run_broadcast(stubs, args, name='retry-storm', groups=args.storm_groups, telegram=telegram)
+
+
+def run_commands(stubs, args):
+    """Process a burst of command updates through the Application's handlers"""
+    import command_handler
+    from telegram import Update
+
+    subscribe_groups(100)
+    stubs.profiles['telegram'] = FaultProfile(latency=args.telegram_latency_ms / 1000.0, jitter=0.2)
+    commands = ('/status', '/subscribe', '/help', '/unsubscribe', '/schedule')
+
+    async def scenario():
+        app = command_handler.build_application()
+        await app.initialize()
+        stubs.reset_stats()
+
+        updates = []
+        for i in range(args.commands):
+            text = commands[i % len(commands)]
+            chat_id = -2000000000000 - i
+            updates.append(Update.de_json({
+                'update_id': i + 1,
+                'message': {
+                    'message_id': i + 1,
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'supergroup', 'title': f'Bench {i}'},
+                    'from': {'id': 42, 'is_bot': False, 'first_name': 'Bench'},
+                    'text': text,
+                    'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+                },
+            }, app.bot))
+
+        samples = []
+        limit = asyncio.Semaphore(max(1, command_handler.COMMAND_CONCURRENT_UPDATES))
+
+        async def process(update):
+            async with limit:
+                update_started = time.perf_counter()
+                await app.process_update(update)
+                samples.append(time.perf_counter() - update_started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(process(update) for update in updates))
+        wall = time.perf_counter() - started
+        await app.shutdown()
+        return samples, wall
+
+    samples, wall = asyncio.run(scenario())
+    return summarize('commands', samples, wall, stubs)
+
+
+RUNNERS = {
+    'single-report': run_single_report,
+    'broadcast': run_broadcast,
+    'retry-storm': run_retry_storm,
+    'commands': run_commands,
+}
+
+
+# ============================================================================
+# REPORTING
+# ============================================================================
+
+def print_results(results):
+    """Print one summary line per scenario"""
+    print("\n" + "=" * 100)
+    print(f"{'scenario':<15}{'ops':>7}{'wall s':>9}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}"
+          f"{'p99 ms':>9}{'sent KB':>10}{'recv KB':>10}{'requests':>10}")
+    print("-" * 100)
+    for result in results:
+        latency = result['latency_ms']
+        requests_made = sum(service['requests'] for service in result['services'].values())
+        print(f"{result['scenario']:<15}{result['operations']:>7}{result['wall_seconds']:>9.2f}"
+              f"{result['throughput_per_s']:>9.1f}{latency['p50']:>9.1f}{latency['p95']:>9.1f}"
+              f"{latency['p99']:>9.1f}{result['bytes_sent'] / 1024:>10.1f}"
+              f"{result['bytes_received'] / 1024:>10.1f}{requests_made:>10}")
+    print("=" * 100 + "\n")
+
+
+# ============================================================================
+# MAIN FUNCTION
+# ============================================================================
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Offline benchmarks against local stub servers")
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--groups', type=int, default=10000, help="groups in the broadcast scenario")
+    parser.add_argument('--storm-groups', type=int, default=1000, help="groups in the retry-storm scenario")
+    parser.add_argument('--commands', type=int, default=2000, help="updates in the commands scenario")
+    parser.add_argument('--iterations', type=int, default=5, help="runs of the single-report scenario")
+    parser.add_argument('--perplexity-latency-ms', type=float, default=800)
+    parser.add_argument('--image-latency-ms', type=float, default=400)
+    parser.add_argument('--telegram-latency-ms', type=float, default=20)
+    parser.add_argument('--error-rate', type=float, default=0.05, help="share of 5xx answers in retry-storm")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.1, help="share of 429 answers in retry-storm")
+    parser.add_argument('--retry-after', type=int, default=1, help="retry_after seconds sent with 429s")
+    parser.add_argument('--global-rate', type=float, default=0,
+                        help="BROADCAST_GLOBAL_RATE during the run (0 = unlimited)")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    """Start the stubs, point the bot at them and run the selected scenarios"""
+    args = parse_args(argv)
+    scenarios = args.scenarios or list(SCENARIOS)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    stubs = StubServers().start()
+    print(f"🧪 Stub servers listening on {stubs.base_url}")
+
+    # Configuration is read at import time, so set it before importing the bot
+    os.environ.update(stubs.env())
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:benchmark',
+        'TELEGRAM_CHAT_ID': '-1000000000001',
+        'PERPLEXITY_API_KEY': 'pplx-benchmark',
+        'PERPLEXITY_QUERY': 'Summarize today\'s crypto market news.',
+        'IMAGE_PROMPT': 'crypto market illustration',
+        'BROADCAST_GLOBAL_RATE': str(args.global_rate),
+        'IMAGE_CACHE_ENABLED': 'false',
+        # The stub image is random bytes, not a decodable picture
+        'IMAGE_OPTIMIZE': 'false',
+    })
+
+    # Keep state files (subscriptions, ledger, caches) out of the repository
+    os.chdir(tempfile.mkdtemp(prefix="crypto-bot-bench-"))
+
+    results = []
+    try:
+        for name in scenarios:
+            print(f"\n▶️ Running {name}...")
+            results.append(RUNNERS[name](stubs, args))
+    finally:
+        stubs.stop()
+
+    print_results(results)
+
+    if json_path:
+        with open(json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"📝 Results written to {json_path}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n⚠️ Benchmark interrupted")
+        sys.exit(130)
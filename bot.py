@@ -7,13 +7,33 @@ License: MIT
 Repository: https://github.com/TriggerZzz/Binance_Greek_Angels_Crypto_News
 """
 
+import argparse
+import functools
 import requests
 import json
 import os
 from datetime import datetime
 import sys
+import threading
 import time
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import broadcaster
+import content_budget
+import deadline
+import delivery_ledger
+import group_manager
+import image_buffer
+import image_cache
+import image_optimizer
+import image_pool
+import image_providers
+import metrics
+import rate_limiter
+import report_cache
+import sharding
+import staged_report
+import transport
 
 # ============================================================================
 # CONFIGURATION - All sensitive data loaded from environment variables
@@ -21,30 +41,61 @@ from io import BytesIO
 
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID')
+# Optional private chat the staged image is uploaded to for its file_id
+TELEGRAM_STAGING_CHAT_ID = os.environ.get('TELEGRAM_STAGING_CHAT_ID')
 PERPLEXITY_API_KEY = os.environ.get('PERPLEXITY_API_KEY')
 PERPLEXITY_QUERY = os.environ.get('PERPLEXITY_QUERY')
 IMAGE_PROMPT = os.environ.get('IMAGE_PROMPT')
 
 # API Configuration
-PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
+PERPLEXITY_API_URL = os.environ.get('PERPLEXITY_API_URL', "https://api.perplexity.ai/chat/completions")
 PERPLEXITY_MODEL = "sonar"  # Online model with real-time web search
-PERPLEXITY_MAX_TOKENS = 2000
+PERPLEXITY_MAX_TOKENS = 2000  # Ceiling; the actual limit is derived from the caption budget
 PERPLEXITY_TEMPERATURE = 0.2  # Lower = more factual, less creative
+# Stream tokens and stop once the caption is full (set to 'true' to enable)
+PERPLEXITY_STREAM = os.environ.get('PERPLEXITY_STREAM', 'false').lower() == 'true'
 
 # Image Generation Configuration
-IMAGE_API_URL = "https://image.pollinations.ai/prompt/"
+IMAGE_API_URL = os.environ.get('IMAGE_API_URL', "https://image.pollinations.ai/prompt/")
 IMAGE_WIDTH = 1024
 IMAGE_HEIGHT = 1024
 
+# Pipeline Configuration
+# Download the image while Perplexity is still searching (set to 'false' to run sequentially)
+PIPELINE_PREFETCH_IMAGE = os.environ.get('PIPELINE_PREFETCH_IMAGE', 'true').lower() != 'false'
+
 # Telegram Configuration
+# Override to point the bot at a local Bot API server or a test stand-in
+TELEGRAM_API_BASE_URL = os.environ.get('TELEGRAM_API_BASE_URL', 'https://api.telegram.org').rstrip('/')
 TELEGRAM_MAX_CAPTION_LENGTH = 1020
 
+# Error descriptions meaning a chat will never accept our messages again
+TELEGRAM_GONE_DESCRIPTIONS = (
+    "bot was kicked",
+    "bot was blocked by the user",
+    "bot is not a member",
+    "user is deactivated",
+    "chat not found",
+    "group chat was deleted",
+)
+# Error classes where retrying or falling back to text cannot help
+PERMANENT_ERRORS = ('chat_gone', 'migrated')
+# Uploads that may fail (timeout, 5xx, network) before the photo is given up for the run
+PHOTO_MAX_UPLOADS = int(os.environ.get('PHOTO_MAX_UPLOADS', '2'))
+# 4xx descriptions about one chat's permissions rather than the photo itself
+TELEGRAM_CHAT_SPECIFIC_DESCRIPTIONS = (
+    "not enough rights",
+    "have no rights",
+    "chat_send_photos_forbidden",
+    "need administrator rights",
+)
+
 
 # ============================================================================
 # PERPLEXITY AI FUNCTIONS - REAL-TIME DATA FETCHING
 # ============================================================================
 
-def query_perplexity(prompt, max_retries=3):
+def query_perplexity(prompt, max_retries=3, budget=None):
     """
     Query Perplexity AI API for REAL-TIME crypto market news.
     Uses 'sonar' model which searches the web for current data.
@@ -52,6 +103,7 @@ def query_perplexity(prompt, max_retries=3):
     Args:
         prompt (str): The query prompt to send to Perplexity
         max_retries (int): Maximum number of retry attempts
+        budget (deadline.Deadline): Time budget for all attempts and waits
         
     Returns:
         str: The generated content with REAL data, or None if request fails
@@ -61,6 +113,10 @@ def query_perplexity(prompt, max_retries=3):
         "Content-Type": "application/json"
     }
     
+    # Size the request to what Telegram will actually deliver
+    budget_chars = content_budget.target_chars(TELEGRAM_MAX_CAPTION_LENGTH)
+    max_tokens = content_budget.max_tokens_for(budget_chars, PERPLEXITY_MAX_TOKENS)
+    
     # Get current date for context
     current_date = datetime.utcnow().strftime('%B %d, %Y')
     current_time = datetime.utcnow().strftime('%H:%M UTC')
@@ -85,195 +141,733 @@ def query_perplexity(prompt, max_retries=3):
                 "content": (
                     f"Today's date: {current_date}\n"
                     f"Current time: {current_time} UTC\n\n"
-                    f"IMPORTANT: Fetch REAL-TIME data from TODAY ONLY.\n\n"
+                    f"IMPORTANT: Fetch REAL-TIME data from TODAY ONLY.\n"
+                    f"{content_budget.length_instruction(budget_chars)}\n\n"
                     f"{prompt}"
                 )
             }
         ],
-        "max_tokens": PERPLEXITY_MAX_TOKENS,
+        "max_tokens": max_tokens,
         "temperature": PERPLEXITY_TEMPERATURE,
         "top_p": 0.9
     }
     
+    budget = budget or deadline.Deadline(deadline.NEWS_BUDGET_SECONDS, name="news")
+    
     for attempt in range(1, max_retries + 1):
+        if not budget.can_attempt():
+            print(f"⏰ News budget exhausted before attempt {attempt}")
+            break
+        
+        retry_after = None
+        outcome = 'failed'
+        attempt_started = time.perf_counter()
         try:
             print(f"📡 Querying Perplexity API for REAL-TIME data (attempt {attempt}/{max_retries})...")
-            response = requests.post(
-                PERPLEXITY_API_URL, 
-                headers=headers, 
-                json=payload, 
-                timeout=60  # Longer timeout for web search
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            # Extract the response content
-            content = data['choices'][0]['message']['content']
+            timeout = budget.timeout(60)  # Longer timeout for web search
+            if PERPLEXITY_STREAM:
+                content = stream_perplexity(headers, payload, budget)
+            else:
+                response = transport.post(
+                    PERPLEXITY_API_URL, 
+                    headers=headers, 
+                    json=payload, 
+                    timeout=timeout
+                )
+                response.raise_for_status()
+                data = response.json()
+                
+                # Extract the response content
+                content = data['choices'][0]['message']['content']
             print(f"✅ Received REAL-TIME response ({len(content)} characters)")
             
+            outcome = 'ok'
             return content
             
         except requests.exceptions.Timeout:
             print(f"❌ Attempt {attempt}: Timeout (Perplexity is searching the web...)")
-            if attempt < max_retries:
-                wait_time = attempt * 10
-                print(f"⏳ Waiting {wait_time}s before retry...")
-                time.sleep(wait_time)
             
         except requests.exceptions.HTTPError as e:
-            status_code = e.response.status_code if hasattr(e, 'response') else None
+            status_code = e.response.status_code if e.response is not None else None
             print(f"❌ Attempt {attempt}: HTTP Error {status_code}")
             
-            if status_code and 500 <= status_code < 600:
-                if attempt < max_retries:
-                    wait_time = attempt * 15
-                    print(f"⏳ Server error. Waiting {wait_time}s...")
-                    time.sleep(wait_time)
-                else:
-                    if hasattr(e, 'response'):
-                        print(f"   Response: {e.response.text[:500]}...")
+            if status_code and (status_code == 429 or 500 <= status_code < 600):
+                retry_after = deadline.retry_after_seconds(e.response)
+                if attempt == max_retries:
+                    print(f"   Response: {e.response.text[:500]}...")
             else:
-                if hasattr(e, 'response'):
+                if e.response is not None:
                     print(f"   Response: {e.response.text}")
                 return None
                 
         except requests.exceptions.RequestException as e:
             print(f"❌ Attempt {attempt}: {e}")
-            if attempt < max_retries:
-                time.sleep(attempt * 10)
                 
-        except (KeyError, IndexError) as e:
+        except (KeyError, IndexError, ValueError) as e:
             print(f"❌ Attempt {attempt}: Parse error: {e}")
             return None
+        
+        finally:
+            metrics.observe('perplexity_attempt_seconds', time.perf_counter() - attempt_started, outcome=outcome)
+        
+        if attempt < max_retries:
+            if not wait_before_retry(budget, attempt, retry_after):
+                break
+            metrics.inc('retries_total', upstream='perplexity')
     
-    print(f"❌ All {max_retries} attempts failed - could not fetch real-time data")
+    print(f"❌ All Perplexity attempts failed - could not fetch real-time data")
     return None
 
 
+def wait_before_retry(budget, attempt, retry_after=None):
+    """
+    Sleep with jittered exponential backoff (honoring Retry-After).
+
+    Returns:
+        bool: False if the wait would not leave time for another attempt
+    """
+    wait_time = deadline.backoff_delay(attempt, base=10, cap=30, retry_after=retry_after)
+    if retry_after is not None:
+        print(f"⏳ Server asked to retry after {retry_after:.0f}s")
+    print(f"⏳ Waiting {wait_time:.1f}s before retry ({budget.remaining():.0f}s of {budget.name} budget left)...")
+    
+    if not budget.sleep(wait_time):
+        print(f"⏰ Not enough {budget.name} budget left to retry")
+        return False
+    return True
+
+
+def stream_perplexity(headers, payload, budget=None):
+    """
+    Consume a streaming (SSE) Perplexity completion.
+
+    Tokens are appended as they arrive. Once the text outgrows what will be
+    delivered (the caption, plus follow-ups in split mode) and a clean
+    paragraph boundary exists, the stream is closed so we stop waiting for
+    (and paying for) tokens that would be truncated anyway.
+
+    Returns:
+        str: The assembled content
+    """
+    budget_chars = content_budget.target_chars(TELEGRAM_MAX_CAPTION_LENGTH)
+    stream_payload = dict(payload, stream=True)
+    timeout = budget.timeout(60) if budget else 60
+    content = ""
+
+    with transport.post(
+        PERPLEXITY_API_URL,
+        headers=headers,
+        json=stream_payload,
+        timeout=timeout,
+        stream=True
+    ) as response:
+        response.raise_for_status()
+
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+
+            chunk = json.loads(data)
+            choice = chunk['choices'][0]
+            content += (choice.get('delta') or {}).get('content') or ""
+
+            if len(content) > budget_chars:
+                trimmed = content_budget.trim_at_boundary(content, budget_chars)
+                if trimmed:
+                    print(f"✂️ Budget full, closing stream early ({len(trimmed)} characters kept)")
+                    return trimmed
+
+            if choice.get('finish_reason'):
+                break
+
+            if budget is not None and budget.expired():
+                # Out of time: keep what is usable rather than failing the run
+                trimmed = content_budget.trim_at_boundary(content, budget_chars, min_chars=1)
+                if trimmed:
+                    print(f"⏰ News budget exhausted, using partial stream ({len(trimmed)} characters)")
+                    return trimmed
+                raise requests.exceptions.Timeout("news budget exhausted while streaming")
+
+    if not content:
+        raise ValueError("empty streaming response")
+
+    return content
+
+
 # ============================================================================
 # IMAGE GENERATION FUNCTIONS
 # ============================================================================
 
 def generate_crypto_image():
-    """Generate crypto-themed image using Pollinations.ai (free service)"""
+    """
+    Build the crypto-themed image URLs: Pollinations.ai (free service) with
+    today's date seed first, then the hedges (see image_providers.py).
+
+    Returns:
+        list: Image URLs in the order they are tried
+    """
+    date_suffix = datetime.utcnow().strftime('%Y%m%d')
+    image_urls = image_providers.candidate_urls(IMAGE_API_URL, IMAGE_PROMPT, date_suffix, IMAGE_WIDTH, IMAGE_HEIGHT)
+    
+    print(f"🎨 Generated image URL ({len(image_urls) - 1} hedge(s) available)")
+    print(f"   Preview: {image_urls[0][:100]}...")
+    
+    return image_urls
+
+
+def cached_image(key):
+    """
+    Load an image from the on-disk image cache.
+
+    Returns:
+        ImageBuffer: The cached image, or None on a miss
+    """
+    path = image_cache.image_path(key) if key else None
+    if path is None:
+        return None
     try:
-        date_suffix = datetime.utcnow().strftime('%Y%m%d')
-        prompt_with_date = f"{IMAGE_PROMPT}, seed {date_suffix}"
-        
-        encoded_prompt = requests.utils.quote(prompt_with_date)
-        
-        image_url = (
-            f"{IMAGE_API_URL}{encoded_prompt}"
-            f"?width={IMAGE_WIDTH}"
-            f"&height={IMAGE_HEIGHT}"
-            f"&nologo=true"
-            f"&enhance=true"
-        )
-        
-        print(f"🎨 Generated image URL")
-        print(f"   Preview: {image_url[:100]}...")
-        
-        return image_url
+        return image_buffer.ImageBuffer.from_file(path)
+    except (OSError, image_buffer.ImageTooLarge) as e:
+        print(f"⚠️ Image cache read failed: {e}")
+        return None
+
+
+def download_image(photo_url, timeout=60, cancel=None):
+    """
+    Download the generated image once so it can be sent to every recipient.
+    Images are served from the on-disk image cache when the same prompt URL
+    was already downloaded (e.g. a rerun on the same day).
+
+    The body is streamed in chunks into an ImageBuffer, so the image is never
+    held in memory whole; images above IMAGE_MAX_BYTES are rejected. Setting
+    cancel (an image_providers.Cancellation, set when a hedged request won)
+    closes the response and abandons the download.
+
+    Returns:
+        ImageBuffer: The image, or None if the download fails
+    """
+    key = image_cache.cache_key(photo_url, IMAGE_WIDTH, IMAGE_HEIGHT)
+    cached = cached_image(key)
+    if cached:
+        print(f"♻️ Using cached image ({cached.size:,} bytes)")
+        metrics.inc('image_cache_total', result='hit')
+        return cached
+    metrics.inc('image_cache_total', result='miss')
+
+    image = image_buffer.ImageBuffer()
+    downloaded = False
+    try:
+        print(f"⬇️ Downloading image...")
+        with metrics.timer('image_download_seconds'):
+            with transport.get(photo_url, timeout=timeout, stream=True) as img_response:
+                abort = functools.partial(transport.abort, img_response)
+                if cancel is not None:
+                    cancel.on_cancel(abort)
+                try:
+                    img_response.raise_for_status()
+                    if int(img_response.headers.get('Content-Length') or 0) > image.max_bytes:
+                        raise image_buffer.ImageTooLarge(f"image exceeds {image.max_bytes:,} bytes")
+                    for chunk in img_response.iter_content(image_buffer.IMAGE_CHUNK_BYTES):
+                        if cancel is not None and cancel.is_set():
+                            break
+                        image.write(chunk)
+                    is_image = img_response.headers.get('Content-Type', '').startswith('image/')
+                finally:
+                    if cancel is not None:
+                        cancel.discard(abort)
+
+        if cancel is not None and cancel.is_set():
+            print("✋ Image download cancelled, another request finished first")
+            return None
+
+        print(f"✅ Downloaded ({image.size:,} bytes)")
+
+        if is_image and image:
+            image_cache.store_file(key, image.copy_to)
+        downloaded = True
+        return image
+
+    except requests.exceptions.Timeout:
+        print(f"❌ Timeout while downloading image")
+        return None
+
+    except image_buffer.ImageTooLarge as e:
+        print(f"❌ Image rejected: {e}")
+        return None
+
+    except (requests.exceptions.RequestException, OSError, AttributeError, ValueError) as e:
+        if cancel is not None and cancel.is_set():
+            # The response was closed under us because another request won
+            print("✋ Image download cancelled, another request finished first")
+            return None
+        print(f"❌ Error downloading image: {e}")
+        return None
+
+    finally:
+        if not downloaded:
+            image.close()
+
+
+def prepare_image(budget=None):
+    """
+    Generate the image URLs and download the first image to arrive.
+    The winner is optimized and kept in the fallback image pool.
+
+    Returns:
+        tuple: (image_url, ImageBuffer), or (None, None) if no image arrived in time
+    """
+    with metrics.timer('stage_seconds', stage='image'):
+        timeout = budget.timeout(60) if budget else 60
+        image_url, image = image_providers.race(generate_crypto_image(), download_image, timeout)
+        if image is None:
+            return None, None
         
-    except Exception as e:
-        print(f"❌ Error generating image: {e}")
-        return "https://via.placeholder.com/1024x1024/1a1a2e/16c79a?text=Crypto+News"
+        image = optimize_image(image_url, image)
+        image_pool.add(image)
+        return image_url, image
+
+
+def discard_late_image(future):
+    """Close an image prepare_image() finished after its budget ran out"""
+    if future.exception() is None:
+        image_buffer.discard(future.result()[1])
+
+
+def fallback_image():
+    """
+    An image from the local fallback pool, so the report still goes out as a photo.
+
+    Returns:
+        ImageBuffer: The fallback image, or None if the pool is empty
+    """
+    image = image_pool.pick()
+    if image is None:
+        return None
+    metrics.inc('image_fallback_total')
+    optimized = image_optimizer.optimize(image)
+    image_buffer.discard(image, keep=optimized)
+    return optimized
+
+
+def image_key(image_url):
+    """Image cache key of the image that is uploaded for image_url"""
+    return image_cache.cache_key(image_url, IMAGE_WIDTH, IMAGE_HEIGHT, variant=image_optimizer.variant())
+
+
+def optimize_image(image_url, image):
+    """
+    Re-encode the downloaded image within IMAGE_TARGET_BYTES (see image_optimizer.py).
+    The result is cached, so reruns skip the re-encode. A replaced original
+    is closed.
+
+    Returns:
+        ImageBuffer: The image to upload (the original when optimization is off)
+    """
+    if image is None or not image_optimizer.enabled():
+        return image
+
+    key = image_key(image_url)
+    cached = cached_image(key)
+    if cached:
+        print(f"♻️ Using cached optimized image ({cached.size:,} bytes)")
+        image.close()
+        return cached
+
+    with metrics.timer('stage_seconds', stage='optimize'):
+        optimized = image_optimizer.optimize(image)
+    # Cached even when unchanged, so the report cache can always point at this key
+    image_cache.store_file(key, optimized.copy_to)
+    image_buffer.discard(image, keep=optimized)
+    return optimized
 
 
 # ============================================================================
 # TELEGRAM FUNCTIONS
 # ============================================================================
 
-def send_telegram_photo_downloaded(photo_url, caption):
+def telegram_api_url(method):
+    """Build a Telegram Bot API URL for the given method"""
+    return f"{TELEGRAM_API_BASE_URL}/bot{TELEGRAM_BOT_TOKEN}/{method}"
+
+
+def telegram_post(method, chat_id, data, files=None, timeout=30):
     """
-    Download image first, then send to Telegram as file.
-    This method is more reliable than sending by URL.
+    Call a Telegram send method through the shared rate limiter.
+    A 429 feeds its retry_after back into the limiter and the call is retried.
+
+    Returns:
+        requests.Response: The successful response (raises on other errors)
     """
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
-    
-    if len(caption) > TELEGRAM_MAX_CAPTION_LENGTH:
-        print(f"⚠️ Warning: Caption too long ({len(caption)} chars), truncating...")
-        caption = caption[:TELEGRAM_MAX_CAPTION_LENGTH] + "..."
-    
-    try:
-        print(f"⬇️ Downloading image...")
-        img_response = requests.get(photo_url, timeout=60)
-        img_response.raise_for_status()
+    with metrics.timer('telegram_send_seconds', method=method):
+        return _telegram_post(method, chat_id, data, files, timeout)
+
+
+def _telegram_post(method, chat_id, data, files, timeout):
+    for attempt in range(rate_limiter.TELEGRAM_MAX_RETRIES + 1):
+        rate_limiter.acquire(chat_id)
         
-        image_size = len(img_response.content)
-        print(f"✅ Downloaded ({image_size:,} bytes)")
+        if files:
+            # Uploads stream from the start of the file on every attempt
+            body = image_buffer.MultipartBody(data, files)
+            response = transport.post(telegram_api_url(method), data=body,
+                                      headers={'Content-Type': body.content_type}, timeout=timeout)
+        else:
+            response = transport.post(telegram_api_url(method), data=data, timeout=timeout)
         
-        print(f"📤 Sending photo to Telegram...")
-        files = {
-            'photo': ('crypto_news.png', BytesIO(img_response.content), 'image/png')
-        }
-        data = {
-            'chat_id': TELEGRAM_CHAT_ID,
-            'caption': caption,
-            'parse_mode': 'Markdown'
-        }
+        if response.status_code == 429 and attempt < rate_limiter.TELEGRAM_MAX_RETRIES:
+            retry_after = deadline.retry_after_seconds(response)
+            if retry_after is None:
+                retry_after = deadline.backoff_delay(attempt + 1, base=1, cap=30)
+            rate_limiter.on_retry_after(chat_id, retry_after)
+            metrics.inc('retries_total', upstream='telegram')
+            continue
         
-        response = requests.post(url, files=files, data=data, timeout=60)
         response.raise_for_status()
-        
-        print("✅ Photo with caption sent successfully!")
+        return response
+
+
+def truncate_caption(caption):
+    """Fit the caption into Telegram's caption limit without breaking Markdown"""
+    if len(caption) > TELEGRAM_MAX_CAPTION_LENGTH:
+        print(f"⚠️ Warning: Caption too long ({len(caption)} chars), trimming...")
+        caption = content_budget.fit(caption, TELEGRAM_MAX_CAPTION_LENGTH)
+    return caption
+
+
+class DeliveryResult:
+    """
+    Outcome of one Telegram send.
+    Truthy when the message was delivered, so it can be used like a bool.
+    """
+
+    def __init__(self, ok, message_id=None, error=None, migrate_to_chat_id=None):
+        self.ok = ok
+        self.message_id = message_id
+        self.error = error  # error class such as 'timeout' or 'chat_gone'
+        self.migrate_to_chat_id = migrate_to_chat_id
+
+    def __bool__(self):
+        return self.ok
+
+
+def telegram_error_details(response):
+    """
+    Read Telegram's error payload.
+
+    Returns:
+        tuple: (lowercase description, parameters dict)
+    """
+    try:
+        data = response.json()
+        return (data.get('description') or '').lower(), data.get('parameters') or {}
+    except (ValueError, AttributeError):
+        return '', {}
+
+
+def classify_error(exc):
+    """Map a send exception to a short error class for the delivery ledger"""
+    if isinstance(exc, requests.exceptions.Timeout):
+        return 'timeout'
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        status_code = exc.response.status_code
+        description, parameters = telegram_error_details(exc.response)
+
+        if parameters.get('migrate_to_chat_id'):
+            return 'migrated'
+        if status_code in (400, 403) and any(text in description for text in TELEGRAM_GONE_DESCRIPTIONS):
+            return 'chat_gone'
+        if status_code >= 500:
+            return 'server_error'
+        return {
+            400: 'bad_request',
+            401: 'unauthorized',
+            403: 'forbidden',
+            429: 'rate_limited',
+        }.get(status_code, f'http_{status_code}')
+    if isinstance(exc, requests.exceptions.RequestException):
+        return 'network'
+    return 'unexpected'
+
+
+def failure_result(exc):
+    """Build a failed DeliveryResult from a send exception"""
+    error = classify_error(exc)
+    migrate_to_chat_id = None
+    if error == 'migrated':
+        migrate_to_chat_id = telegram_error_details(exc.response)[1].get('migrate_to_chat_id')
+    return DeliveryResult(False, error=error, migrate_to_chat_id=migrate_to_chat_id)
+
+
+def extract_message_id(response):
+    """Get the message_id from a successful Telegram send response"""
+    try:
+        return response.json()['result']['message_id']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class ReportPhoto:
+    """
+    The report image, uploaded to Telegram once and then reused.
+
+    The first successful sendPhoto uploads the bytes and stores the returned
+    file_id. Every later recipient is sent the file_id only, so upload bytes
+    stay constant no matter how many groups are subscribed. If Telegram
+    rejects the photo itself, or PHOTO_MAX_UPLOADS uploads fail, it is marked
+    unusable and everyone else goes straight to text instead of re-uploading
+    it one by one. Uploads must also fit the delivery budget: each one is
+    checked against it and times out within it, and once it is spent the
+    photo is given up the same way.
+    """
+
+    def __init__(self, image=None, file_id=None, budget=None):
+        self.image = image  # ImageBuffer
+        self.file_id = file_id
+        self.budget = budget  # deadline.Deadline for uploads, None = unbounded
+        self.failed_uploads = 0
+        self.rejected = None  # why the photo is unusable, once it is
+        self._upload_lock = threading.Lock()
+
+    @property
+    def available(self):
+        return not self.rejected and bool(self.file_id or self.image)
+
+    @property
+    def upload_timeout(self):
+        return self.budget.timeout(60) if self.budget is not None else 60
+
+    def can_upload(self):
+        """Whether the delivery budget still allows an upload (gives the photo up if not)"""
+        if self.budget is not None and not self.budget.can_attempt():
+            self.reject("delivery budget spent")
+            return False
         return True
-        
+
+    def reject(self, reason):
+        if not self.rejected:
+            print(f"🚫 Photo unusable ({reason}), sending text to remaining recipients")
+        self.rejected = reason or "rejected"
+
+    def upload_failed(self, exc):
+        """Record a failed upload; the photo is given up when it is to blame"""
+        if chat_specific_error(exc):
+            return
+        if photo_rejected(exc):
+            self.reject(f"Telegram rejected it: {telegram_error_details(exc.response)[0]}")
+            return
+        self.failed_uploads += 1
+        if self.failed_uploads >= PHOTO_MAX_UPLOADS:
+            self.reject(f"{self.failed_uploads} upload(s) failed, last with {classify_error(exc)}")
+
+
+def extract_file_id(response_json):
+    """Get the file_id of the largest photo size from a sendPhoto response"""
+    try:
+        sizes = response_json['result']['photo']
+        return sizes[-1]['file_id'] if sizes else None
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def post_photo(photo, caption, chat_id):
+    """
+    Call sendPhoto, by file_id when known, otherwise by streaming the image.
+
+    Returns:
+        requests.Response: The successful Telegram response
+    """
+    data = {
+        'chat_id': chat_id,
+        'caption': caption,
+        'parse_mode': 'Markdown'
+    }
+
+    if photo.file_id:
+        data['photo'] = photo.file_id
+        return telegram_post("sendPhoto", chat_id, data, timeout=30)
+
+    content_type = photo.image.content_type
+    filename = f"crypto_news.{image_buffer.EXTENSIONS[content_type]}"
+    with photo.image.reader() as image_file:
+        files = {
+            'photo': (filename, image_file, content_type)
+        }
+        response = telegram_post("sendPhoto", chat_id, data, files=files, timeout=photo.upload_timeout)
+
+    file_id = extract_file_id(response.json())
+    if file_id:
+        photo.file_id = file_id
+        print(f"🆔 Photo uploaded once, reusing file_id for remaining recipients")
+    return response
+
+
+def chat_specific_error(exc):
+    """True when a send failed because of the chat (or bot), not the photo"""
+    response = getattr(exc, 'response', None)
+    if response is None:
+        return False
+    if response.status_code in (401, 429) or failure_result(exc).error in PERMANENT_ERRORS:
+        return True
+    description = telegram_error_details(response)[0]
+    return any(text in description for text in TELEGRAM_CHAT_SPECIFIC_DESCRIPTIONS)
+
+
+def photo_rejected(exc):
+    """True when a sendPhoto 4xx is about the photo rather than one chat"""
+    response = getattr(exc, 'response', None)
+    if response is None or not 400 <= response.status_code < 500:
+        return False
+    return not chat_specific_error(exc)
+
+
+def send_telegram_photo(photo, caption, chat_id=None):
+    """
+    Send the report photo to a Telegram chat.
+    Only one upload happens at a time; everyone else waits for its file_id.
+    Falls back to a text-only message if the send fails, and for every later
+    recipient once the photo is unusable (see ReportPhoto).
+
+    Returns:
+        DeliveryResult: Outcome of the photo (or fallback text) send
+    """
+    chat_id = chat_id or TELEGRAM_CHAT_ID
+    caption = truncate_caption(caption)
+
+    if photo is None or not photo.available:
+        print("⚠️ No image available, sending text-only message...")
+        return send_telegram_message(caption, chat_id)
+
+    try:
+        print(f"📤 Sending photo to Telegram chat {chat_id}...")
+        if photo.file_id:
+            response = post_photo(photo, caption, chat_id)
+        else:
+            with photo._upload_lock:
+                uploading = not photo.file_id
+                if not photo.available or (uploading and not photo.can_upload()):
+                    # Given up while we waited for the upload
+                    return send_telegram_message(caption, chat_id)
+                try:
+                    response = post_photo(photo, caption, chat_id)
+                except Exception as e:
+                    # Counted under the lock, so the next waiter sees it
+                    if uploading:
+                        photo.upload_failed(e)
+                    raise
+
+        print(f"✅ Photo with caption sent to {chat_id}!")
+        return DeliveryResult(True, message_id=extract_message_id(response))
+
     except requests.exceptions.Timeout:
-        print(f"❌ Timeout while downloading or sending image")
+        print(f"❌ Timeout while sending image to {chat_id}")
         print("⚠️ Falling back to text-only message...")
-        return send_telegram_message(caption)
-        
+        return send_telegram_message(caption, chat_id)
+
     except requests.exceptions.RequestException as e:
         print(f"❌ Error: {e}")
         if hasattr(e, 'response') and e.response is not None:
             print(f"   Status: {e.response.status_code}")
             print(f"   Response: {e.response.text[:500]}")
+
+        result = failure_result(e)
+        if result.error in PERMANENT_ERRORS:
+            print(f"🚫 Chat {chat_id} unreachable as-is ({result.error}), skipping text fallback")
+            return result
+
         print("⚠️ Falling back to text-only message...")
-        return send_telegram_message(caption)
-        
+        return send_telegram_message(caption, chat_id)
+
     except Exception as e:
         print(f"❌ Unexpected error: {e}")
         print("⚠️ Falling back to text-only message...")
-        return send_telegram_message(caption)
+        return send_telegram_message(caption, chat_id)
 
 
-def send_telegram_message(text):
-    """Fallback: send text-only message to Telegram"""
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    
+def send_telegram_message(text, chat_id=None):
+    """
+    Fallback: send text-only message to Telegram
+
+    Returns:
+        DeliveryResult: Outcome of the send
+    """
+    chat_id = chat_id or TELEGRAM_CHAT_ID
+
     params = {
-        "chat_id": TELEGRAM_CHAT_ID,
+        "chat_id": chat_id,
         "text": text,
         "parse_mode": "Markdown",
         "disable_web_page_preview": False
     }
     
     try:
-        print(f"📤 Sending text-only message to Telegram...")
-        response = requests.post(url, data=params, timeout=10)
-        response.raise_for_status()
-        print("✅ Text message sent successfully!")
-        return True
+        print(f"📤 Sending text-only message to Telegram chat {chat_id}...")
+        response = telegram_post("sendMessage", chat_id, params, timeout=10)
+        print(f"✅ Text message sent to {chat_id}!")
+        return DeliveryResult(True, message_id=extract_message_id(response))
         
     except requests.exceptions.RequestException as e:
         print(f"❌ Error: {e}")
-        return False
+        return failure_result(e)
+
+
+def deliver_report(photo, caption, followups, chat_id):
+    """
+    Send the report photo with its caption, then any overflow follow-ups.
+    If the group was migrated to a supergroup, the report is resent to the
+    new chat ID and the result carries migrate_to_chat_id.
+
+    Returns:
+        DeliveryResult: Outcome of the caption (photo or text fallback) send
+    """
+    result = send_telegram_photo(photo, caption, chat_id)
+
+    if not result and result.migrate_to_chat_id:
+        new_chat_id = str(result.migrate_to_chat_id)
+        print(f"🔀 Chat {chat_id} migrated to {new_chat_id}, resending...")
+        chat_id = new_chat_id
+        result = send_telegram_photo(photo, caption, chat_id)
+        result.migrate_to_chat_id = new_chat_id
+
+    if not result:
+        return result
+
+    for text in followups:
+        send_telegram_message(text, chat_id)
+    return result
+
+
+def get_recipients():
+    """
+    Collect every chat that should receive the report:
+    the configured TELEGRAM_CHAT_ID plus all subscribed groups.
+    """
+    recipients = [str(TELEGRAM_CHAT_ID)] + group_manager.get_all_groups()
+    return list(dict.fromkeys(recipients))
 
 
 # ============================================================================
 # VALIDATION FUNCTIONS
 # ============================================================================
 
-def validate_environment():
-    """Validate that all required environment variables are set"""
+def validate_environment(content=True):
+    """
+    Validate that all required environment variables are set.
+    Shards only deliver a prepared report, so they skip the content settings.
+    """
     required_vars = {
         'TELEGRAM_BOT_TOKEN': TELEGRAM_BOT_TOKEN,
         'TELEGRAM_CHAT_ID': TELEGRAM_CHAT_ID,
-        'PERPLEXITY_API_KEY': PERPLEXITY_API_KEY,
-        'PERPLEXITY_QUERY': PERPLEXITY_QUERY,
-        'IMAGE_PROMPT': IMAGE_PROMPT
     }
+    if content:
+        required_vars.update({
+            'PERPLEXITY_API_KEY': PERPLEXITY_API_KEY,
+            'PERPLEXITY_QUERY': PERPLEXITY_QUERY,
+            'IMAGE_PROMPT': IMAGE_PROMPT
+        })
     
     missing_vars = [name for name, value in required_vars.items() if not value]
     
@@ -309,77 +903,519 @@ def print_config_status():
 
 
 # ============================================================================
-# MAIN FUNCTION
+# REPORT PIPELINE
 # ============================================================================
 
-def main():
-    """Main execution function"""
-    
-    print("\n" + "=" * 70)
-    print("🤖 CRYPTO NEWS TELEGRAM BOT - REAL-TIME DATA")
-    print("=" * 70)
-    print(f"⏰ Time: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
-    print(f"🐍 Python: {sys.version.split()[0]}")
-    
-    # Validate environment
-    is_valid, missing_vars = validate_environment()
-    
-    if not is_valid:
-        print("\n❌ ERROR: Missing required variables!")
-        print_config_status()
-        print("\nMissing:")
-        for var in missing_vars:
-            print(f"   - {var}")
-        sys.exit(1)
+def generate_report(budget=None):
+    """
+    Produce the report content and image, then store it in the report cache.
+
+    The image prompt does not depend on the news content, so (unless
+    PIPELINE_PREFETCH_IMAGE is off) the image is generated and downloaded
+    in the background while Perplexity searches the web. Each stage gets its
+    own time budget; an image that misses its budget is dropped so the
+    report goes out text-only instead of late.
+
+    Returns:
+        dict: {'content', 'image_url', 'image'}, or None if Perplexity failed
+    """
+    run_budget = budget or deadline.run_deadline()
     
-    print_config_status()
+    # Step 1: Start image generation in the background
+    image_future = None
+    image_budget = None
+    if PIPELINE_PREFETCH_IMAGE:
+        print("=" * 70)
+        print("STEP 1: Prefetching Image in Background")
+        print("=" * 70)
+        image_budget = run_budget.stage("image", deadline.IMAGE_BUDGET_SECONDS)
+        image_executor = ThreadPoolExecutor(max_workers=1)
+        image_future = image_executor.submit(prepare_image, image_budget)
+        image_executor.shutdown(wait=False)
     
-    # Step 1: Get REAL-TIME crypto news
+    # Step 2: Get REAL-TIME crypto news
     print("=" * 70)
-    print("STEP 1: Fetching REAL-TIME Crypto News from Perplexity AI")
+    print("STEP 2: Fetching REAL-TIME Crypto News from Perplexity AI")
     print("=" * 70)
     
-    content = query_perplexity(PERPLEXITY_QUERY)
+    news_budget = run_budget.stage("news", deadline.NEWS_BUDGET_SECONDS)
+    with metrics.timer('stage_seconds', stage='news'):
+        content = query_perplexity(PERPLEXITY_QUERY, budget=news_budget)
     
     if not content:
-        print("\n❌ Failed to get REAL-TIME content from Perplexity")
-        error_msg = (
-            f"⚠️ *Daily Report Failed*\n\n"
-            f"Could not fetch real-time crypto data.\n"
-            f"Time: {datetime.utcnow().strftime('%H:%M UTC')}\n"
-            f"Date: {datetime.utcnow().strftime('%Y-%m-%d')}\n\n"
-            f"Check GitHub Actions logs for details."
-        )
-        send_telegram_message(error_msg)
-        sys.exit(1)
+        return None
     
-    # Step 2: Generate image
+    # Step 3: Collect (or generate) image
     print("\n" + "=" * 70)
-    print("STEP 2: Generating Image")
+    print("STEP 3: Generating Image")
     print("=" * 70)
     
-    image_url = generate_crypto_image()
+    image_url, image = None, None
+    if image_future is not None:
+        try:
+            image_url, image = image_future.result(timeout=image_budget.remaining())
+        except FutureTimeoutError:
+            print("⏰ Image budget exhausted")
+            image_future.add_done_callback(discard_late_image)
+        except Exception as e:
+            print(f"❌ Image preparation failed: {e}")
+    else:
+        image_budget = run_budget.stage("image", deadline.IMAGE_BUDGET_SECONDS)
+        if image_budget.can_attempt():
+            try:
+                image_url, image = prepare_image(image_budget)
+            except Exception as e:
+                print(f"❌ Image preparation failed: {e}")
+                image_url, image = None, None
+        else:
+            print("⏰ No time budget left for the image")
     
-    # Step 3: Send to Telegram
-    print("\n" + "=" * 70)
-    print("STEP 3: Sending to Telegram")
-    print("=" * 70)
+    if image is None:
+        image_url, image = None, fallback_image()
+    if image is None:
+        print("⚠️ Image unavailable, report will be sent as text-only")
     
-    success = send_telegram_photo_downloaded(image_url, content)
+    report_cache.save_report(content, image_url=image_url, image_key=image_key(image_url) if image_url else None)
     
-    # Final status
+    return {
+        'content': content,
+        'image_url': image_url,
+        'image': image,
+    }
+
+
+def resume_report(ledger):
+    """
+    Reuse today's cached report when a previous run already delivered it to
+    some chats, so a rerun sends the same content instead of a new search.
+
+    Returns:
+        dict: Report like generate_report() returns, or None to generate anew
+    """
+    if not ledger.entries():
+        return None
+    
+    entry = report_cache.load_report()
+    if not entry:
+        return None
+    
+    generated_on = datetime.utcfromtimestamp(entry.get('generated_at', 0)).strftime('%Y-%m-%d')
+    if generated_on != ledger.date:
+        return None
+    
+    print(f"♻️ Resuming delivery of the report generated on {generated_on}")
+    return {
+        'content': entry['content'],
+        'image_url': entry.get('image_url'),
+        'image': cached_image(entry.get('image_key')),
+        'file_id': entry.get('file_id'),
+    }
+
+
+# ============================================================================
+# DELIVERY
+# ============================================================================
+
+def build_photo(report, run_budget):
+    """
+    ReportPhoto for delivery, or None when the deadline forces text-only.
+    Uploads are bounded by the delivery budget for the whole broadcast.
+    """
+    delivery_budget = run_budget.stage("delivery", deadline.DELIVERY_BUDGET_SECONDS)
+    photo = ReportPhoto(report.get('image'), file_id=report.get('file_id'), budget=delivery_budget)
+    if photo.available and not delivery_budget.can_attempt():
+        print("⏰ Run deadline reached, degrading to text-only delivery")
+        return None
+    return photo
+
+
+def broadcast_report(photo, caption, followups, recipients, ledger):
+    """
+    Deliver to every recipient the ledger does not already mark as delivered.
+
+    Returns:
+        tuple: (number of chats that have the report, group_manager.ChangeBatch)
+    """
+    already_delivered = ledger.delivered_chats()
+    pending = [chat_id for chat_id in recipients if chat_id not in already_delivered]
+    skipped = len(recipients) - len(pending)
+    if skipped:
+        print(f"⏭️ Skipping {skipped} chat(s) already delivered on {ledger.date}")
+    
+    changes = group_manager.ChangeBatch()
+    
+    def send_and_record(chat_id):
+        result = deliver_report(photo, caption, followups, chat_id)
+        ledger.record(chat_id, bool(result), message_id=result.message_id, error=result.error)
+        metrics.inc('deliveries_total', result='delivered' if result else (result.error or 'failed'))
+        
+        if result.migrate_to_chat_id:
+            if result:
+                # The resend went to the new chat, which is what the store holds from now on
+                ledger.record(result.migrate_to_chat_id, True, message_id=result.message_id)
+            changes.migrate(chat_id, result.migrate_to_chat_id)
+            if chat_id == str(TELEGRAM_CHAT_ID):
+                print(f"⚠️ TELEGRAM_CHAT_ID migrated, update the secret to {result.migrate_to_chat_id}")
+        elif result.error == 'chat_gone':
+            changes.remove(chat_id)
+        return result
+    
+    with metrics.timer('stage_seconds', stage='delivery'):
+        results = broadcaster.broadcast(pending, send_and_record)
+    
+    summary = ledger.summary()
+    if summary['errors']:
+        print(f"📒 Failures by error class: {summary['errors']}")
+    
+    delivered = skipped + sum(1 for ok in results.values() if ok)
+    return delivered, changes
+
+
+def notify_report_failed():
+    """Tell TELEGRAM_CHAT_ID that no report could be generated"""
+    print("\n❌ Failed to get REAL-TIME content from Perplexity")
+    error_msg = (
+        f"⚠️ *Daily Report Failed*\n\n"
+        f"Could not fetch real-time crypto data.\n"
+        f"Time: {datetime.utcnow().strftime('%H:%M UTC')}\n"
+        f"Date: {datetime.utcnow().strftime('%Y-%m-%d')}\n\n"
+        f"Check GitHub Actions logs for details."
+    )
+    send_telegram_message(error_msg)
+
+
+def report_failed():
+    """Report the failure to TELEGRAM_CHAT_ID, then exit"""
+    notify_report_failed()
+    sys.exit(1)
+
+
+def print_final_status(success, content, delivered, total):
+    """Print the closing summary block"""
     print("\n" + "=" * 70)
     if success:
         print("✅ SUCCESS: REAL-TIME report delivered!")
         print(f"📊 Content: {len(content)} chars")
         print(f"🎨 Image: Generated with today's date seed")
+        print(f"📣 Delivered: {delivered}/{total} chats")
     else:
         print("❌ FAILED: Could not deliver report")
     print("=" * 70 + "\n")
+
+
+# ============================================================================
+# RUN MODES
+# ============================================================================
+
+def deliver_to_all(report, run_budget, ledger):
+    """
+    Step 4: broadcast a generated report to TELEGRAM_CHAT_ID and every group.
+    
+    Returns:
+        bool: True if at least one chat received the report
+    """
+    content = report['content']
+    
+    print("\n" + "=" * 70)
+    print("STEP 4: Broadcasting to Telegram")
+    print("=" * 70)
+    
+    caption, followups = content_budget.split_for_delivery(content, TELEGRAM_MAX_CAPTION_LENGTH)
+    content_budget.record_delivery(len(content), len(caption) + sum(len(text) for text in followups))
     
+    photo = build_photo(report, run_budget)
+    recipients = get_recipients()
+    delivered, changes = broadcast_report(photo, caption, followups, recipients, ledger)
+    
+    # Prune dead chats and follow migrations in one write
+    changes.apply()
+    if photo is not None:
+        report_cache.update_file_id(photo.file_id)
+    
+    success = delivered > 0
+    print_final_status(success, content, delivered, len(recipients))
+    return success
+
+
+def stage_report(run_budget=None):
+    """
+    Phase one of a staged run: generate and validate the report, upload the
+    image to TELEGRAM_STAGING_CHAT_ID for its file_id and stage it for release.
+
+    Returns:
+        dict: The staged report, or None if it could not be generated
+    """
+    run_budget = run_budget or deadline.run_deadline()
+    report = generate_report(run_budget)
+    if not report:
+        return None
+    
+    content = report['content']
+    caption, followups = content_budget.split_for_delivery(content, TELEGRAM_MAX_CAPTION_LENGTH)
+    if not caption.strip() or not content_budget.is_well_formed_markdown(caption):
+        print("❌ Generated content failed validation (empty or unbalanced Markdown)")
+        return None
+    
+    file_id = None
+    if TELEGRAM_STAGING_CHAT_ID and report['image']:
+        print("📤 Uploading image to the staging chat...")
+        photo = ReportPhoto(report['image'])
+        send_telegram_photo(photo, caption, TELEGRAM_STAGING_CHAT_ID)
+        file_id = photo.file_id
+        if file_id:
+            report_cache.update_file_id(file_id)
+    
+    staged = {
+        'date': delivery_ledger.report_date(),
+        'content': content,
+        'caption': caption,
+        'followups': followups,
+        'image_url': report['image_url'],
+        'file_id': file_id,
+    }
+    staged_report.save(staged, image=report['image'])
+    if file_id:
+        # Delivery sends the file_id; the image only lives on in the staging dir
+        image_buffer.discard(report['image'])
+    staged['image'] = None if file_id else report['image']
+    return staged
+
+
+def release_report(ledger, run_budget):
+    """
+    The report to release: today's staged report if there is one, otherwise
+    today's partially delivered report, otherwise a freshly generated one.
+    """
+    report = staged_report.load(ledger.date)
+    if report is not None:
+        print(f"📦 Releasing the report staged for {ledger.date}")
+        return report
+    
+    print("⚠️ No staged report for today, generating one now")
+    return resume_report(ledger) or generate_report(run_budget)
+
+
+def run_full():
+    """Generate the report and deliver it to every recipient in this process"""
+    # A rerun of the same day resumes from the delivery ledger
+    run_budget = deadline.run_deadline()
+    ledger = delivery_ledger.DeliveryLedger()
+    
+    # Steps 1-3: Generate news content and image (or reuse today's report)
+    report = resume_report(ledger)
+    if report is None:
+        report = generate_report(run_budget)
+    
+    if not report:
+        report_failed()
+    
+    success = deliver_to_all(report, run_budget, ledger)
+    sys.exit(0 if success else 1)
+
+
+def run_stage():
+    """Phase one: stage today's report ahead of the send time"""
+    print("\n" + "=" * 70)
+    print(f"STAGING: Preparing the report for release at {staged_report.REPORT_TIME_UTC} UTC")
+    print("=" * 70)
+    
+    # A rerun keeps the content already staged (and maybe partly delivered) today
+    if staged_report.load(delivery_ledger.report_date()) is not None:
+        print("✅ Today's report is already staged")
+        sys.exit(0)
+    
+    if not stage_report():
+        print("❌ Staging failed, the release step will generate the report itself")
+        sys.exit(1)
+    
+    print("✅ Report staged")
+    sys.exit(0)
+
+
+def run_release():
+    """Phase two: wait for the send time, then broadcast the staged report"""
+    ledger = delivery_ledger.DeliveryLedger()
+    report = release_report(ledger, deadline.run_deadline())
+    
+    if not report:
+        report_failed()
+    
+    staged_report.wait_for_release()
+    
+    # The run deadline covers delivery only; generation happened earlier
+    success = deliver_to_all(report, deadline.run_deadline(), ledger)
+    sys.exit(0 if success else 1)
+
+
+def run_prepare():
+    """
+    Coordinator for sharded delivery: generate the report once, deliver it to
+    TELEGRAM_CHAT_ID (which also yields the photo file_id) and write the
+    report artifact the shards deliver from.
+    """
+    run_budget = deadline.run_deadline()
+    report = generate_report(run_budget)
+    
+    if not report:
+        report_failed()
+    
+    content = report['content']
+    caption, followups = content_budget.split_for_delivery(content, TELEGRAM_MAX_CAPTION_LENGTH)
+    content_budget.record_delivery(len(content), len(caption) + sum(len(text) for text in followups))
+    
+    print("\n" + "=" * 70)
+    print("STEP 4: Delivering to TELEGRAM_CHAT_ID and Writing Report Artifact")
+    print("=" * 70)
+    
+    photo = build_photo(report, run_budget)
+    ledger = delivery_ledger.DeliveryLedger(suffix=".coordinator")
+    delivered, _ = broadcast_report(photo, caption, followups, [str(TELEGRAM_CHAT_ID)], ledger)
+    
+    file_id = photo.file_id if photo is not None else None
+    report_cache.update_file_id(file_id)
+    sharding.write_artifact({
+        'date': ledger.date,
+        'content': content,
+        'caption': caption,
+        'followups': followups,
+        'image_url': report['image_url'],
+        'file_id': file_id,
+    }, image=report['image'] if photo is not None else None)
+    
+    print_final_status(True, content, delivered, 1)
+    sys.exit(0)
+
+
+def run_shard(spec):
+    """Deliver the prepared report to the subscribed groups in one shard"""
+    index, count = sharding.parse_shard(spec)
+    
+    print("=" * 70)
+    print(f"SHARD {index}/{count}: Delivering Prepared Report")
+    print("=" * 70)
+    
+    try:
+        report = sharding.read_artifact()
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read report artifact: {e}")
+        sys.exit(1)
+    
+    # All shards share one bot, so each gets an equal slice of the global rate
+    rate_limiter.set_global_rate(rate_limiter.TELEGRAM_GLOBAL_RATE / count)
+    
+    primary = str(TELEGRAM_CHAT_ID)
+    groups = [chat_id for chat_id in group_manager.get_all_groups() if chat_id != primary]
+    recipients = sharding.select(groups, index, count)
+    print(f"📦 Shard {index}/{count}: {len(recipients)} of {len(groups)} group(s)")
+    
+    photo = build_photo(report, deadline.run_deadline())
+    ledger = delivery_ledger.DeliveryLedger(date=report.get('date'), suffix=f".shard-{index}-of-{count}")
+    delivered, changes = broadcast_report(
+        photo, report['caption'], report.get('followups', []), recipients, ledger
+    )
+    sharding.write_changes(index, count, changes.removed, changes.migrated)
+    
+    success = delivered > 0 or not recipients
+    print_final_status(success, report['content'], delivered, len(recipients))
     sys.exit(0 if success else 1)
 
 
+def run_apply_changes():
+    """Merge the subscription changes reported by all shards into the store"""
+    removed, migrated = sharding.read_changes()
+    print(f"🧹 Applying shard changes: {len(removed)} removal(s), {len(migrated)} migration(s)")
+    group_manager.apply_changes(removed, migrated)
+    sys.exit(0)
+
+
+# ============================================================================
+# MAIN FUNCTION
+# ============================================================================
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Crypto News Telegram Bot")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--stage', action='store_true',
+                      help="generate the report ahead of time and stage it for release")
+    mode.add_argument('--release', action='store_true',
+                      help="wait for REPORT_TIME_UTC, then broadcast the staged report")
+    mode.add_argument('--prepare', action='store_true',
+                      help="generate the report and write the artifact for sharded delivery")
+    mode.add_argument('--shard', metavar='i/N',
+                      help="deliver the prepared report to shard i of N (0-based)")
+    mode.add_argument('--apply-changes', action='store_true',
+                      help="merge subscription changes written by the shards")
+    return parser.parse_args(argv)
+
+
+def run_mode(args):
+    """Name of the run for the metrics report"""
+    if args.apply_changes:
+        return "apply-changes"
+    if args.stage:
+        return "stage"
+    if args.release:
+        return "release"
+    if args.prepare:
+        return "prepare"
+    if args.shard:
+        return "shard-" + args.shard.replace("/", "-of-")
+    return "full"
+
+
+def main(argv=None):
+    """Main execution function"""
+    args = parse_args(argv)
+    
+    # Every run mode ends in sys.exit(); record its outcome on the way out
+    exit_code = 1
+    try:
+        dispatch(args)
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = e.code
+        raise
+    finally:
+        metrics.write_run_report(run_mode(args), success=exit_code in (0, None))
+
+
+def dispatch(args):
+    """Validate the environment and run the selected mode"""
+    print("\n" + "=" * 70)
+    print("🤖 CRYPTO NEWS TELEGRAM BOT - REAL-TIME DATA")
+    print("=" * 70)
+    print(f"⏰ Time: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC")
+    print(f"🐍 Python: {sys.version.split()[0]}")
+    
+    if args.apply_changes:
+        run_apply_changes()
+    
+    # Validate environment
+    is_valid, missing_vars = validate_environment(content=not args.shard)
+    
+    if not is_valid:
+        print("\n❌ ERROR: Missing required variables!")
+        print_config_status()
+        print("\nMissing:")
+        for var in missing_vars:
+            print(f"   - {var}")
+        sys.exit(1)
+    
+    print_config_status()
+    
+    if args.stage:
+        run_stage()
+    elif args.release:
+        run_release()
+    elif args.prepare:
+        run_prepare()
+    elif args.shard:
+        run_shard(args.shard)
+    else:
+        run_full()
+
+
 # ============================================================================
 # ENTRY POINT
 # ============================================================================
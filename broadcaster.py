@@ -0,0 +1,56 @@
+"""
+Broadcast Engine
+Fans the daily report out to every subscribed group concurrently
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Sends are paced by rate_limiter; this only bounds how many run at once
+BROADCAST_MAX_WORKERS = int(os.environ.get('BROADCAST_MAX_WORKERS', '8'))
+
+
+def broadcast(chat_ids, send_func, max_workers=None):
+    """
+    Deliver to every chat through a bounded worker pool.
+
+    Args:
+        chat_ids (list): Chat IDs to deliver to (duplicates are ignored)
+        send_func (callable): send_func(chat_id) -> bool, expected to pace
+            itself through rate_limiter
+        max_workers (int): Pool size, defaults to BROADCAST_MAX_WORKERS
+
+    Returns:
+        dict: chat_id -> True/False delivery result
+    """
+    recipients = list(dict.fromkeys(str(chat_id) for chat_id in chat_ids if chat_id))
+    results = {}
+
+    if not recipients:
+        print("ℹ️ No recipients to broadcast to")
+        return results
+
+    workers = max(1, min(max_workers or BROADCAST_MAX_WORKERS, len(recipients)))
+    print(f"📣 Broadcasting to {len(recipients)} chat(s) with {workers} worker(s)...")
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(send_func, chat_id): chat_id for chat_id in recipients}
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            chat_id = futures[future]
+            try:
+                results[chat_id] = bool(future.result())
+            except Exception as e:
+                print(f"❌ Unexpected error delivering to {chat_id}: {e}")
+                results[chat_id] = False
+
+            if done % 100 == 0:
+                print(f"   ... {done}/{len(recipients)} processed")
+
+    delivered = sum(1 for ok in results.values() if ok)
+    elapsed = time.monotonic() - started
+    print(f"📣 Broadcast finished: {delivered}/{len(recipients)} delivered in {elapsed:.1f}s")
+
+    return results
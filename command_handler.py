@@ -3,13 +3,95 @@ Telegram Command Handler Bot
 Handles interactive commands for the Crypto Market Daily bot
 """
 
+import asyncio
 import os
 import sys
+import time
+from urllib.parse import urlparse
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import (
+    Application, ApplicationHandlerStop, BaseRateLimiter, CommandHandler, ContextTypes, TypeHandler
+)
+from telegram.request import HTTPXRequest
+import bot as report_bot
 import group_manager
+import handler_metrics
+import rate_limiter
+import report_cache
+import update_offset
 
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
+# Updates handled at the same time (1 = one after another)
+COMMAND_CONCURRENT_UPDATES = int(os.environ.get('COMMAND_CONCURRENT_UPDATES', '32'))
+
+# Webhook mode (used when TELEGRAM_WEBHOOK_URL is set, otherwise long polling)
+TELEGRAM_WEBHOOK_URL = os.environ.get('TELEGRAM_WEBHOOK_URL')  # public https URL Telegram posts to
+WEBHOOK_LISTEN = os.environ.get('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.environ.get('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET_TOKEN = os.environ.get('WEBHOOK_SECRET_TOKEN')
+
+# Every command arrives as a message; other update types are never handled
+ALLOWED_UPDATES = [Update.MESSAGE]
+
+# Updates fetched per getUpdates call while catching up on startup (Telegram allows 100)
+BACKLOG_BATCH_SIZE = 100
+# Group commands that change a subscription; a backlog keeps only each chat's last one
+SUBSCRIPTION_COMMANDS = ('/start', '/subscribe', '/unsubscribe')
+
+# Updates up to this id were already answered before a restart
+_resume_after = None
+
+# Shared in-flight report refresh, so concurrent /latest misses trigger
+# a single Perplexity search instead of one per request
+_refresh_task = None
+
+class SharedRateLimiter(BaseRateLimiter):
+    """
+    Routes every Bot API request made by the Application through rate_limiter,
+    so command replies share the global and per-chat buckets with broadcasts.
+    A RetryAfter (429) pauses the limiter and the request is retried.
+    """
+    
+    async def initialize(self):
+        pass
+    
+    async def shutdown(self):
+        pass
+    
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id') if data else None
+        started = time.perf_counter()
+        
+        try:
+            for attempt in range(rate_limiter.TELEGRAM_MAX_RETRIES + 1):
+                # Only message-sending calls are paced; getUpdates and friends pass straight through
+                if chat_id is not None:
+                    await rate_limiter.acquire_async(chat_id)
+                try:
+                    return await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    if attempt == rate_limiter.TELEGRAM_MAX_RETRIES:
+                        raise
+                    retry_after = getattr(e.retry_after, 'total_seconds', lambda: e.retry_after)()
+                    rate_limiter.on_retry_after(chat_id, retry_after)
+                    if chat_id is None:
+                        await asyncio.sleep(retry_after)
+        finally:
+            handler_metrics.observe_bot_api(endpoint, time.perf_counter() - started)
+
+class PollingRequest(HTTPXRequest):
+    """
+    Connection used for getUpdates. PTB sends getUpdates past the rate limiter,
+    so the polling round trip is timed here instead.
+    """
+    
+    async def do_request(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(*args, **kwargs)
+        finally:
+            handler_metrics.observe_bot_api('getUpdates', time.perf_counter() - started)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
@@ -33,7 +115,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Group chat - auto-subscribe
         chat_name = update.effective_chat.title
         
-        if group_manager.add_group(chat_id):
+        if await group_manager.add_group_async(chat_id):
             await update.message.reply_text(
                 f"✅ *Subscribed Successfully!*\n\n"
                 f"'{chat_name}' will now receive daily crypto market reports!\n\n"
@@ -59,7 +141,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "*Group Management:*\n"
         "/subscribe - Subscribe this group to daily reports\n"
         "/unsubscribe - Unsubscribe from daily reports\n"
-        "/status - Check subscription status\n\n"
+        "/status - Check subscription status\n"
+        "/latest - Get the latest report now\n\n"
         "*Information:*\n"
         "/help - Show this help message\n"
         "/about - About this bot\n"
@@ -89,13 +172,13 @@ async def subscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     chat_name = update.effective_chat.title
     
-    if group_manager.add_group(chat_id):
+    if await group_manager.add_group_async(chat_id):
         await update.message.reply_text(
             f"✅ *Subscribed!*\n\n"
             f"'{chat_name}' will receive daily crypto reports.\n\n"
             f"📅 Monday-Friday at 17:00 UTC\n"
             f"📊 Market analysis with AI-generated images\n\n"
-            f"Total subscribers: {group_manager.get_group_count()}",
+            f"Total subscribers: {await group_manager.get_group_count_async()}",
             parse_mode='Markdown'
         )
     else:
@@ -118,7 +201,7 @@ async def unsubscribe(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     chat_name = update.effective_chat.title
     
-    if group_manager.remove_group(chat_id):
+    if await group_manager.remove_group_async(chat_id):
         await update.message.reply_text(
             f"✅ *Unsubscribed*\n\n"
             f"'{chat_name}' will no longer receive daily reports.\n\n"
@@ -136,7 +219,7 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_type = update.effective_chat.type
     
     if chat_type == "private":
-        total_groups = group_manager.get_group_count()
+        total_groups = await group_manager.get_group_count_async()
         await update.message.reply_text(
             f"🔄 *Bot Status*\n\n"
             f"✅ Online and operational\n"
@@ -148,7 +231,7 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
     else:
         chat_id = update.effective_chat.id
-        is_sub = group_manager.is_subscribed(chat_id)
+        is_sub = await group_manager.is_subscribed_async(chat_id)
         status_emoji = "✅" if is_sub else "❌"
         status_text = "Subscribed" if is_sub else "Not Subscribed"
         
@@ -161,6 +244,70 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
 
+def _generate_report_entry():
+    """Run the report pipeline and return the new cache entry"""
+    report = report_bot.generate_report()
+    return report_cache.load_report() if report else None
+
+async def refresh_report():
+    """
+    Regenerate the cached report (single-flight).
+    Every caller that arrives while a refresh is running awaits the same task.
+    """
+    global _refresh_task
+    
+    if not (report_bot.PERPLEXITY_API_KEY and report_bot.PERPLEXITY_QUERY and report_bot.IMAGE_PROMPT):
+        print("⚠️ Report refresh skipped: Perplexity/image settings not configured")
+        return None
+    
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(asyncio.to_thread(_generate_report_entry))
+    
+    try:
+        # shield() keeps one cancelled caller from cancelling everyone's refresh
+        return await asyncio.shield(_refresh_task)
+    except Exception as e:
+        print(f"❌ Report refresh failed: {e}")
+        return None
+
+async def latest(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Handle /latest command.
+    Only the service (which broadcasts the report itself) regenerates a stale
+    report; the standalone handler serves the last broadcast report as is.
+    """
+    entry = await asyncio.to_thread(report_cache.load_report)
+    
+    if not report_cache.is_fresh(entry) and context.bot_data.get('refresh_latest'):
+        entry = await refresh_report() or entry
+    
+    if not entry:
+        await update.message.reply_text(
+            "⚠️ *No Report Available*\n\n"
+            "The latest report could not be loaded right now.\n"
+            "Please try again later.",
+            parse_mode='Markdown'
+        )
+        return
+    
+    caption = report_bot.truncate_caption(entry['content'])
+    photo = entry.get('file_id') or await asyncio.to_thread(report_cache.load_image, entry)
+    
+    if photo:
+        try:
+            message = await update.message.reply_photo(
+                photo=photo,
+                caption=caption,
+                parse_mode='Markdown'
+            )
+            if message.photo and not entry.get('file_id'):
+                await asyncio.to_thread(report_cache.update_file_id, message.photo[-1].file_id)
+            return
+        except TelegramError as e:
+            print(f"⚠️ Could not send cached photo: {e}")
+    
+    await update.message.reply_text(caption, parse_mode='Markdown')
+
 async def schedule(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /schedule command"""
     await update.message.reply_text(
@@ -241,6 +388,161 @@ async def feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parse_mode='Markdown'
     )
 
+def subscription_chat(update):
+    """Chat ID if the update is a group /start, /subscribe or /unsubscribe, else None"""
+    message = update.message
+    if message is None or not message.text or message.chat.type == "private":
+        return None
+    command = message.text.split()[0].split('@')[0].lower()
+    return message.chat_id if command in SUBSCRIPTION_COMMANDS else None
+
+def collapse_subscriptions(updates):
+    """Drop subscription commands superseded by a later one from the same chat"""
+    last = {}
+    for update in updates:
+        chat_id = subscription_chat(update)
+        if chat_id is not None:
+            last[chat_id] = update.update_id
+    
+    return [
+        update for update in updates
+        if subscription_chat(update) is None or last[subscription_chat(update)] == update.update_id
+    ]
+
+async def drain_backlog(app):
+    """
+    Answer the updates queued while the handler was down.
+    The whole backlog is fetched in batches first (each getUpdates call
+    confirms the previous batch, and the loop only ends on an empty batch, so
+    polling never sees an answered update again), then repeated subscription
+    commands are collapsed across all of it and the rest is processed at most
+    COMMAND_CONCURRENT_UPDATES at a time.
+    """
+    global _resume_after
+    
+    await app.bot.delete_webhook()
+    offset = _resume_after + 1 if _resume_after is not None else None
+    backlog = []
+    
+    while True:
+        updates = await app.bot.get_updates(
+            offset=offset, limit=BACKLOG_BATCH_SIZE, timeout=0, allowed_updates=ALLOWED_UPDATES
+        )
+        if not updates:
+            break
+        backlog.extend(updates)
+        offset = updates[-1].update_id + 1
+    
+    if backlog:
+        pending = collapse_subscriptions(backlog)
+        limit = asyncio.Semaphore(max(1, COMMAND_CONCURRENT_UPDATES))
+        
+        async def process(update):
+            async with limit:
+                await app.process_update(update)
+        
+        await asyncio.gather(*(process(update) for update in pending))
+        update_offset.mark_processed(backlog[-1].update_id)
+        await asyncio.to_thread(update_offset.flush, True)
+        print(f"📥 Caught up on {len(backlog)} queued update(s), {len(pending)} after collapsing repeats")
+    
+    if offset is not None:
+        _resume_after = offset - 1
+
+async def catch_up(app):
+    """post_init: load the offset checkpoint, then drain the backlog when polling"""
+    global _resume_after
+    _resume_after = await asyncio.to_thread(update_offset.load)
+    
+    if not TELEGRAM_WEBHOOK_URL:
+        await drain_backlog(app)
+
+async def save_offset(app):
+    """post_shutdown: write the final offset checkpoint"""
+    await asyncio.to_thread(update_offset.flush, True)
+
+async def startup(app):
+    """post_init: start collecting metrics, then catch up on missed updates"""
+    await handler_metrics.start()
+    await catch_up(app)
+
+async def shutdown(app):
+    """post_shutdown: save the offset checkpoint and the final metrics"""
+    await save_offset(app)
+    await handler_metrics.stop()
+
+async def skip_answered(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Stop updates Telegram redelivers after a restart that were already answered"""
+    if _resume_after is not None and update.update_id <= _resume_after:
+        raise ApplicationHandlerStop
+
+async def checkpoint_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Record the update as processed once its command handler has finished"""
+    update_offset.mark_processed(update.update_id)
+    await asyncio.to_thread(update_offset.flush)
+
+def build_application(refresh_latest=False):
+    """
+    Create the Application with every command handler registered.
+    refresh_latest lets /latest regenerate a stale report (service mode).
+    """
+    app = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(f"{report_bot.TELEGRAM_API_BASE_URL}/bot")
+        .base_file_url(f"{report_bot.TELEGRAM_API_BASE_URL}/file/bot")
+        .rate_limiter(SharedRateLimiter())
+        .get_updates_request(PollingRequest(connection_pool_size=1))
+        .concurrent_updates(max(1, COMMAND_CONCURRENT_UPDATES))
+        .post_init(startup)
+        .post_shutdown(shutdown)
+        .build()
+    )
+    
+    app.bot_data['refresh_latest'] = refresh_latest
+    
+    # Handler groups run in order: skip answered updates first, checkpoint last
+    app.add_handler(TypeHandler(Update, skip_answered), group=-1)
+    app.add_handler(TypeHandler(Update, checkpoint_update), group=1)
+    
+    # Add command handlers, each counted and timed
+    commands = (
+        ("start", start),
+        ("help", help_command),
+        ("subscribe", subscribe),
+        ("unsubscribe", unsubscribe),
+        ("status", status),
+        ("latest", latest),
+        ("schedule", schedule),
+        ("about", about),
+        ("privacy", privacy),
+        ("feedback", feedback),
+    )
+    for name, callback in commands:
+        app.add_handler(CommandHandler(name, handler_metrics.instrumented(name, callback)))
+    
+    return app
+
+def run_application(app):
+    """Serve updates through a webhook when TELEGRAM_WEBHOOK_URL is set, otherwise by long polling"""
+    if not TELEGRAM_WEBHOOK_URL:
+        print("📡 Mode: long polling")
+        app.run_polling(allowed_updates=ALLOWED_UPDATES)
+        return
+    
+    if not WEBHOOK_SECRET_TOKEN:
+        print("⚠️ WEBHOOK_SECRET_TOKEN not set, webhook requests will not be authenticated")
+    
+    print(f"🌐 Mode: webhook on {WEBHOOK_LISTEN}:{WEBHOOK_PORT} for {TELEGRAM_WEBHOOK_URL}")
+    app.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=urlparse(TELEGRAM_WEBHOOK_URL).path.lstrip('/'),
+        webhook_url=TELEGRAM_WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET_TOKEN or None,
+        allowed_updates=ALLOWED_UPDATES,
+    )
+
 def main():
     """Main function to run the command handler bot"""
     
@@ -257,25 +559,14 @@ def main():
     print("=" * 60 + "\n")
     
     # Create application
-    app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    
-    # Add command handlers
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("subscribe", subscribe))
-    app.add_handler(CommandHandler("unsubscribe", unsubscribe))
-    app.add_handler(CommandHandler("status", status))
-    app.add_handler(CommandHandler("schedule", schedule))
-    app.add_handler(CommandHandler("about", about))
-    app.add_handler(CommandHandler("privacy", privacy))
-    app.add_handler(CommandHandler("feedback", feedback))
+    app = build_application()
     
     # Start bot
     print("✅ Command handler bot is running...")
     print("📝 Listening for commands from users...\n")
     
     try:
-        app.run_polling(allowed_updates=Update.ALL_TYPES)
+        run_application(app)
     except KeyboardInterrupt:
         print("\n⚠️ Bot stopped by user")
     except Exception as e:
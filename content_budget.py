@@ -0,0 +1,241 @@
+"""
+Content Budget
+Sizes Perplexity output to what Telegram will actually deliver
+
+Derives the token limit and a length instruction from the caption limit,
+cuts text only at paragraph/line boundaries that leave every Markdown entity
+closed (Telegram rejects captions with a half-open *bold* or _italic_), can
+carry overflow into follow-up messages, and records how much of each
+generated report was actually delivered.
+"""
+
+import json
+import math
+import os
+from datetime import datetime
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# 'truncate' keeps only what fits in the caption, 'split' sends the rest as follow-up messages
+CONTENT_OVERFLOW_MODE = os.environ.get('CONTENT_OVERFLOW_MODE', 'truncate').lower()
+CONTENT_MAX_FOLLOWUPS = int(os.environ.get('CONTENT_MAX_FOLLOWUPS', '1'))
+# Emojis and numbers tokenize poorly, so assume fewer characters per token than plain English
+CONTENT_CHARS_PER_TOKEN = float(os.environ.get('CONTENT_CHARS_PER_TOKEN', '3.0'))
+CONTENT_TOKEN_HEADROOM = float(os.environ.get('CONTENT_TOKEN_HEADROOM', '1.3'))
+# A clean cut must keep at least this share of the limit, otherwise a hard cut is used
+CONTENT_MIN_BOUNDARY_FILL = float(os.environ.get('CONTENT_MIN_BOUNDARY_FILL', '0.5'))
+CONTENT_STATS_FILE = os.environ.get('CONTENT_STATS_FILE', 'content_stats.jsonl')
+
+# Markers Telegram Markdown lets us escape with a backslash
+ESCAPABLE_MARKERS = ('*', '_', '`', '[')
+
+
+# ============================================================================
+# BUDGETING
+# ============================================================================
+
+def target_chars(caption_limit):
+    """Characters worth generating for one report"""
+    if CONTENT_OVERFLOW_MODE == 'split':
+        return caption_limit + CONTENT_MAX_FOLLOWUPS * TELEGRAM_MESSAGE_LIMIT
+    return caption_limit
+
+
+def max_tokens_for(chars, ceiling):
+    """Token limit for a completion of about chars characters, capped at ceiling"""
+    tokens = math.ceil(chars / CONTENT_CHARS_PER_TOKEN * CONTENT_TOKEN_HEADROOM)
+    return max(64, min(ceiling, tokens))
+
+
+def length_instruction(chars):
+    """Prompt line asking the model to stay within the delivery budget"""
+    return (
+        f"HARD LIMIT: The entire answer must be under {chars} characters (with spaces), "
+        f"including emojis and hashtags."
+    )
+
+
+# ============================================================================
+# MARKDOWN-SAFE SPLITTING
+# ============================================================================
+
+def _unescaped(text):
+    """text without backslash-escaped markers, which Telegram shows literally"""
+    for marker in ESCAPABLE_MARKERS:
+        text = text.replace('\\' + marker, '')
+    return text
+
+
+def is_well_formed_markdown(text):
+    """Check that Telegram Markdown entities (*bold*, _italic_, `code`, [links]) are all closed"""
+    text = _unescaped(text)
+    if text.count('```') % 2:
+        return False
+    text = text.replace('```', '')
+    for marker in ('*', '_', '`'):
+        if text.count(marker) % 2:
+            return False
+    return text.count('[') == text.count(']')
+
+
+def trim_at_boundary(text, limit, min_chars=None):
+    """
+    Cut text to at most limit characters at the paragraph or line break
+    closest to the limit that leaves every Markdown entity closed.
+
+    Args:
+        min_chars: Shortest acceptable result; defaults to
+            CONTENT_MIN_BOUNDARY_FILL of the limit, so a report is not cut
+            down to its title when only line breaks fall near the limit
+
+    Returns:
+        str: The trimmed text, or None if no clean boundary is close enough
+    """
+    end = min(len(text), limit)
+    if min_chars is None:
+        min_chars = int(end * CONTENT_MIN_BOUNDARY_FILL)
+
+    best = None
+    for separator in ("\n\n", "\n"):
+        cut = text.rfind(separator, 0, end + 1)
+        while cut > 0:
+            candidate = text[:cut].rstrip()
+            if candidate and is_well_formed_markdown(candidate):
+                if best is None or len(candidate) > len(best):
+                    best = candidate
+                break
+            cut = text.rfind(separator, 0, cut)
+
+    if best and len(best) >= max(1, min_chars):
+        return best
+    return None
+
+
+def _unbalanced_marker(text):
+    """The first Markdown marker left open in text, or None if all are closed"""
+    text = _unescaped(text)
+    if text.count('```') % 2:
+        return '```'
+    single = text.replace('```', '')
+    for marker in ('*', '_', '`'):
+        if single.count(marker) % 2:
+            return marker
+    if text.count('[') > text.count(']'):
+        return '['
+    if text.count(']') > text.count('['):
+        return ']'
+    return None
+
+
+def _last_unescaped(text, marker):
+    """Index of the last occurrence of marker that is not escaped or part of a ``` fence"""
+    index = text.rfind(marker)
+    while index >= 0:
+        escaped = index > 0 and text[index - 1] == '\\'
+        fence = marker == '`' and '```' in text[max(0, index - 2):index + 3]
+        if not escaped and not fence:
+            return index
+        index = text.rfind(marker, 0, index)
+    return -1
+
+
+def _balance(piece):
+    """Make every marker left unmatched in piece literal"""
+    marker = _unbalanced_marker(piece)
+    while marker:
+        index = _last_unescaped(piece, marker)
+        if index < 0:
+            break
+        if marker in ESCAPABLE_MARKERS:
+            piece = piece[:index] + '\\' + piece[index:]
+        else:
+            piece = piece[:index] + piece[index + len(marker):]
+        marker = _unbalanced_marker(piece)
+    return piece
+
+
+def _hard_cut(text, limit):
+    """
+    Last resort when no clean boundary exists: cut at a word boundary, make
+    the markers the cut left unmatched literal (escaped, or dropped for ```
+    fences and stray brackets) so the rest of the formatting and names like
+    BTC_USD survive, and add an ellipsis.
+
+    Returns:
+        tuple: (piece, number of source characters consumed)
+    """
+    end = max(0, limit - 3)
+    cut = text.rfind(" ", 0, end + 1)
+    source = text[:cut if cut > 0 else end].rstrip()
+    piece = _balance(source)
+
+    # Escapes add characters; give back whole words until the piece fits again
+    while len(piece) > end and source:
+        space = source.rfind(" ")
+        source = source[:space].rstrip() if space > 0 else source[:-1]
+        piece = _balance(source)
+
+    return piece + "...", len(source)
+
+
+def _fit(text, limit):
+    """Returns (piece, number of source characters consumed)"""
+    if len(text) <= limit:
+        return text, len(text)
+
+    trimmed = trim_at_boundary(text, limit)
+    if trimmed:
+        return trimmed, len(trimmed)
+    return _hard_cut(text, limit)
+
+
+def fit(text, limit):
+    """Fit text into limit characters without breaking Markdown"""
+    return _fit(text, limit)[0]
+
+
+def split_for_delivery(text, caption_limit):
+    """
+    Split a report into a photo caption and optional follow-up messages.
+    Follow-ups are only produced when CONTENT_OVERFLOW_MODE is 'split'.
+
+    Returns:
+        tuple: (caption, [follow-up message texts])
+    """
+    caption, consumed = _fit(text, caption_limit)
+    if CONTENT_OVERFLOW_MODE != 'split':
+        return caption, []
+
+    followups = []
+    rest = text[consumed:].strip()
+
+    while rest and len(followups) < CONTENT_MAX_FOLLOWUPS:
+        chunk, consumed = _fit(rest, TELEGRAM_MESSAGE_LIMIT)
+        followups.append(chunk)
+        rest = rest[consumed:].strip()
+
+    return caption, followups
+
+
+# ============================================================================
+# DELIVERY STATS
+# ============================================================================
+
+def record_delivery(generated_chars, delivered_chars):
+    """Log and persist the generated-vs-delivered character ratio of a report"""
+    ratio = delivered_chars / generated_chars if generated_chars else 0.0
+    print(f"📏 Content budget: {delivered_chars}/{generated_chars} chars delivered ({ratio:.0%})")
+
+    entry = {
+        'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'generated_chars': generated_chars,
+        'delivered_chars': delivered_chars,
+        'ratio': round(ratio, 4),
+    }
+    try:
+        with open(CONTENT_STATS_FILE, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+        print(f"⚠️ Could not record content stats: {e}")
+
+    return ratio
@@ -0,0 +1,114 @@
+"""
+Run Deadline
+End-to-end time budget for a report run, split into per-stage budgets
+
+A run gets RUN_DEADLINE_SECONDS in total. Each stage (news, image, delivery)
+receives its own budget, never more than what is left of the run. Retries
+use jittered exponential backoff capped by the remaining budget and honor
+Retry-After, so a bad upstream day degrades the report early (for example to
+text-only) instead of delivering it many minutes late.
+"""
+
+import email.utils
+import os
+import random
+import time
+
+RUN_DEADLINE_SECONDS = float(os.environ.get('RUN_DEADLINE_SECONDS', '300'))
+NEWS_BUDGET_SECONDS = float(os.environ.get('NEWS_BUDGET_SECONDS', '180'))
+IMAGE_BUDGET_SECONDS = float(os.environ.get('IMAGE_BUDGET_SECONDS', '90'))
+DELIVERY_BUDGET_SECONDS = float(os.environ.get('DELIVERY_BUDGET_SECONDS', '120'))
+
+# Never start a network call with less time than this left
+MIN_ATTEMPT_SECONDS = 5.0
+
+
+class Deadline:
+    """A point in time by which a run (or one of its stages) must finish"""
+
+    def __init__(self, seconds, name="run", parent=None):
+        self.name = name
+        self.parent = parent
+        self.expires_at = time.monotonic() + seconds
+        if parent is not None:
+            self.expires_at = min(self.expires_at, parent.expires_at)
+
+    def remaining(self):
+        """Seconds left, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def can_attempt(self):
+        """Whether enough time is left to make another network call"""
+        return self.remaining() >= MIN_ATTEMPT_SECONDS
+
+    def timeout(self, cap):
+        """A request timeout of at most cap seconds that ends within the deadline"""
+        return max(1.0, min(cap, self.remaining()))
+
+    def stage(self, name, seconds):
+        """Start a stage budget bounded by this deadline"""
+        return Deadline(seconds, name=name, parent=self)
+
+    def sleep(self, seconds):
+        """
+        Sleep unless it would run past the deadline.
+
+        Returns:
+            bool: True if slept, False if the delay does not fit
+        """
+        if seconds >= self.remaining() - MIN_ATTEMPT_SECONDS:
+            return False
+        time.sleep(seconds)
+        return True
+
+
+def run_deadline():
+    """A fresh deadline for a whole report run"""
+    return Deadline(RUN_DEADLINE_SECONDS)
+
+
+def backoff_delay(attempt, base=5.0, cap=60.0, retry_after=None):
+    """
+    Full-jitter exponential backoff for the given 1-based attempt.
+    A server-provided Retry-After always wins over a shorter computed delay.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def retry_after_seconds(response):
+    """
+    Read a retry delay from an HTTP response.
+    Understands the Retry-After header (seconds or HTTP date) and Telegram's
+    JSON parameters.retry_after field.
+
+    Returns:
+        float: Seconds to wait, or None if the response gives no hint
+    """
+    if response is None:
+        return None
+
+    header = response.headers.get('Retry-After')
+    if header:
+        try:
+            return max(0.0, float(header))
+        except ValueError:
+            try:
+                when = email.utils.parsedate_to_datetime(header)
+                return max(0.0, when.timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+    try:
+        retry_after = response.json().get('parameters', {}).get('retry_after')
+        if retry_after is not None:
+            return float(retry_after)
+    except (ValueError, AttributeError, TypeError):
+        pass
+
+    return None
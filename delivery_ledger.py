@@ -0,0 +1,142 @@
+"""
+Delivery Ledger
+Per-report record of which chats already received the daily report
+
+Every send appends one JSON line (chat id, status, message id, error class)
+to delivery_ledger/<report date>.jsonl while the broadcast runs. A rerun of
+the same day's report reads the ledger back, skips chats marked delivered and
+retries only the ones that failed or were never reached. Ledgers older than
+DELIVERY_LEDGER_KEEP_DAYS are deleted when a ledger is opened, so the
+directory (cached between workflow runs) does not grow without bound.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+DELIVERY_LEDGER_DIR = os.environ.get('DELIVERY_LEDGER_DIR', 'delivery_ledger')
+DELIVERY_LEDGER_KEEP_DAYS = int(os.environ.get('DELIVERY_LEDGER_KEEP_DAYS', '7'))
+
+STATUS_DELIVERED = 'delivered'
+STATUS_FAILED = 'failed'
+
+
+def report_date():
+    """Ledger key for today's report"""
+    return datetime.utcnow().strftime('%Y-%m-%d')
+
+
+def prune(keep_days=None):
+    """
+    Delete ledgers for report dates more than keep_days before today.
+
+    Returns:
+        int: Number of ledger files removed
+    """
+    keep_days = DELIVERY_LEDGER_KEEP_DAYS if keep_days is None else keep_days
+    cutoff = (datetime.utcnow() - timedelta(days=keep_days)).strftime('%Y-%m-%d')
+
+    try:
+        names = os.listdir(DELIVERY_LEDGER_DIR)
+    except FileNotFoundError:
+        return 0
+
+    removed = 0
+    for name in names:
+        # <YYYY-MM-DD><suffix>.jsonl; ISO dates compare correctly as strings
+        if not name.endswith('.jsonl') or name[:10] >= cutoff:
+            continue
+        try:
+            datetime.strptime(name[:10], '%Y-%m-%d')
+            os.remove(os.path.join(DELIVERY_LEDGER_DIR, name))
+            removed += 1
+        except (ValueError, OSError):
+            continue
+
+    if removed:
+        print(f"🧹 Removed {removed} delivery ledger(s) older than {keep_days} days")
+    return removed
+
+
+class DeliveryLedger:
+    """Append-only delivery log for one report date"""
+
+    def __init__(self, date=None, suffix=""):
+        prune()
+        self.date = date or report_date()
+        self.path = os.path.join(DELIVERY_LEDGER_DIR, f"{self.date}{suffix}.jsonl")
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        """Read existing entries; the last line for a chat wins"""
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        entries[str(entry['chat_id'])] = entry
+                    except (ValueError, KeyError, TypeError):
+                        # Torn final line from an interrupted run
+                        continue
+        except OSError as e:
+            print(f"⚠️ Could not read delivery ledger: {e}")
+
+        return entries
+
+    def delivered_chats(self):
+        """Chat IDs that already received this report"""
+        with self._lock:
+            return {
+                chat_id for chat_id, entry in self._entries.items()
+                if entry.get('status') == STATUS_DELIVERED
+            }
+
+    def entries(self):
+        """Latest entry per chat"""
+        with self._lock:
+            return dict(self._entries)
+
+    def record(self, chat_id, delivered, message_id=None, error=None):
+        """Append the outcome of one delivery attempt"""
+        entry = {
+            'chat_id': str(chat_id),
+            'status': STATUS_DELIVERED if delivered else STATUS_FAILED,
+            'message_id': message_id,
+            'error': error,
+            'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        }
+
+        with self._lock:
+            self._entries[entry['chat_id']] = entry
+            try:
+                os.makedirs(DELIVERY_LEDGER_DIR, exist_ok=True)
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                print(f"⚠️ Could not write delivery ledger: {e}")
+
+        return entry
+
+    def summary(self):
+        """Counts of delivered and failed chats, plus failures by error class"""
+        with self._lock:
+            entries = list(self._entries.values())
+
+        delivered = sum(1 for entry in entries if entry['status'] == STATUS_DELIVERED)
+        errors = {}
+        for entry in entries:
+            if entry['status'] == STATUS_FAILED:
+                error = entry.get('error') or 'unknown'
+                errors[error] = errors.get(error, 0) + 1
+
+        return {
+            'delivered': delivered,
+            'failed': len(entries) - delivered,
+            'errors': errors,
+        }
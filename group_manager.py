@@ -1,78 +1,349 @@
 """
 Group Subscription Manager
 Manages which Telegram groups are subscribed to daily reports
+
+Subscriptions are kept in an in-memory index so lookups and counts are O(1).
+Changes are appended to a journal file (one JSON line per add/remove) and
+periodically compacted into an atomic snapshot of subscribed_groups.json.
+The journal starts with the hash of the snapshot it extends, so a journal
+left behind by a crash between writing a snapshot and removing the journal
+is recognised as stale and never replayed over the newer snapshot.
+
+The *_async variants are for the command handler's event loop: they run the
+same calls on a small dedicated thread pool, so journal writes and lock waits
+never stall other updates. Their latency is recorded as store_op_seconds.
 """
 
+import asyncio
+import hashlib
 import json
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
 
 GROUPS_FILE = "subscribed_groups.json"
+GROUPS_LOG_FILE = "subscribed_groups.log"
+GROUPS_COMPACT_THRESHOLD = int(os.environ.get('GROUPS_COMPACT_THRESHOLD', '500'))
+GROUPS_IO_WORKERS = int(os.environ.get('GROUPS_IO_WORKERS', '4'))
 
-def load_groups():
-    """Load list of subscribed group IDs from file"""
+_lock = threading.RLock()
+_groups = None       # dict used as an insertion-ordered set: chat_id -> True
+_log_entries = 0     # journal lines written since the last snapshot
+_snapshot_id = None  # hash of the snapshot the journal extends
+_executor = ThreadPoolExecutor(max_workers=max(1, GROUPS_IO_WORKERS), thread_name_prefix="group-store")
+
+
+def _snapshot_hash(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _read_snapshot():
+    """
+    Read the last snapshot from GROUPS_FILE.
+    Returns (group IDs, snapshot hash or None if there is no snapshot)
+    """
     if not os.path.exists(GROUPS_FILE):
-        return []
-    
+        return [], None
+
     try:
-        with open(GROUPS_FILE, 'r') as f:
-            data = json.load(f)
-            return data if isinstance(data, list) else []
+        with open(GROUPS_FILE, 'rb') as f:
+            raw = f.read()
     except Exception as e:
         print(f"Error loading groups: {e}")
-        return []
+        return [], None
 
-def save_groups(groups):
-    """Save list of subscribed group IDs to file"""
     try:
-        with open(GROUPS_FILE, 'w') as f:
-            json.dump(groups, f, indent=2)
-        return True
+        data = json.loads(raw)
+        groups = [str(chat_id) for chat_id in data] if isinstance(data, list) else []
     except Exception as e:
-        print(f"Error saving groups: {e}")
-        return False
+        print(f"Error loading groups: {e}")
+        groups = []
+    return groups, _snapshot_hash(raw)
+
+
+def _replay_log(groups, snapshot_id):
+    """
+    Apply journal entries written after the snapshot.
+    A journal whose header names a different snapshot predates it and is skipped.
+    Returns (entry count, True if every line was readable and current)
+    """
+    if not os.path.exists(GROUPS_LOG_FILE):
+        return 0, True
+
+    entries = 0
+    clean = True
+    try:
+        with open(GROUPS_LOG_FILE, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    if 'snapshot' in entry:
+                        if entry['snapshot'] != snapshot_id:
+                            print("ℹ️ Skipping group journal written before the current snapshot")
+                            return 0, False
+                        continue
+                    op, chat_id = entry['op'], str(entry['chat_id'])
+                except (ValueError, KeyError, TypeError):
+                    # A torn final line from a crash mid-write; ignore it
+                    clean = False
+                    continue
+
+                if op == 'add':
+                    groups[chat_id] = True
+                elif op == 'remove':
+                    groups.pop(chat_id, None)
+                entries += 1
+    except Exception as e:
+        print(f"Error replaying group journal: {e}")
+        clean = False
+
+    return entries, clean
+
+
+def _ensure_loaded():
+    """Build the in-memory index on first use"""
+    global _groups, _log_entries, _snapshot_id
+
+    if _groups is None:
+        snapshot, _snapshot_id = _read_snapshot()
+        groups = dict.fromkeys(snapshot, True)
+        _log_entries, clean = _replay_log(groups, _snapshot_id)
+        _groups = groups
+
+        if not clean:
+            # Rewrite the snapshot so new entries never follow a torn line
+            compact()
+    return _groups
+
+
+def _append_log(op, chat_id):
+    """Durably append one change to the journal"""
+    global _log_entries
+
+    new_journal = not os.path.exists(GROUPS_LOG_FILE) or os.path.getsize(GROUPS_LOG_FILE) == 0
+    with open(GROUPS_LOG_FILE, 'a') as f:
+        if new_journal:
+            f.write(json.dumps({'snapshot': _snapshot_id}) + "\n")
+        f.write(json.dumps({'op': op, 'chat_id': chat_id}) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    _log_entries += 1
+
+    if _log_entries >= GROUPS_COMPACT_THRESHOLD:
+        compact()
+
+
+def reload_groups():
+    """Drop the in-memory index and rebuild it from disk"""
+    global _groups
+
+    with _lock:
+        _groups = None
+        return list(_ensure_loaded())
+
+
+def load_groups():
+    """Load list of subscribed group IDs"""
+    with _lock:
+        return list(_ensure_loaded())
+
+
+def save_groups(groups):
+    """
+    Save list of subscribed group IDs as an atomic snapshot.
+    The file is written to a temporary path and renamed into place, so a
+    crash never leaves a half-written subscribed_groups.json behind; a crash
+    before the old journal is removed leaves a stale journal that is skipped.
+    """
+    global _groups, _log_entries, _snapshot_id
+
+    with _lock:
+        groups = [str(chat_id) for chat_id in groups]
+        directory = os.path.dirname(os.path.abspath(GROUPS_FILE))
+        data = json.dumps(groups, indent=2).encode('utf-8')
+
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".groups-", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, GROUPS_FILE)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            # The snapshot now contains everything; start a fresh journal
+            _snapshot_id = _snapshot_hash(data)
+            if os.path.exists(GROUPS_LOG_FILE):
+                os.remove(GROUPS_LOG_FILE)
+            _groups = dict.fromkeys(groups, True)
+            _log_entries = 0
+            return True
+        except Exception as e:
+            print(f"Error saving groups: {e}")
+            return False
+
+
+def compact():
+    """Fold the journal into a fresh snapshot of the current subscriptions"""
+    with _lock:
+        return save_groups(list(_ensure_loaded()))
+
 
 def add_group(chat_id):
     """
     Add a new group to subscriptions
     Returns True if added, False if already exists
     """
-    groups = load_groups()
     chat_id_str = str(chat_id)  # Ensure string for consistency
-    
-    if chat_id_str not in groups:
-        groups.append(chat_id_str)
-        save_groups(groups)
-        print(f"✅ Added group {chat_id_str} to subscriptions")
-        return True
-    
+
+    with _lock:
+        groups = _ensure_loaded()
+
+        if chat_id_str not in groups:
+            groups[chat_id_str] = True
+            try:
+                _append_log('add', chat_id_str)
+            except Exception as e:
+                print(f"Error saving groups: {e}")
+            print(f"✅ Added group {chat_id_str} to subscriptions")
+            return True
+
     print(f"ℹ️ Group {chat_id_str} already subscribed")
     return False
 
+
 def remove_group(chat_id):
     """
     Remove a group from subscriptions
     Returns True if removed, False if not found
     """
-    groups = load_groups()
     chat_id_str = str(chat_id)
-    
-    if chat_id_str in groups:
-        groups.remove(chat_id_str)
-        save_groups(groups)
-        print(f"✅ Removed group {chat_id_str} from subscriptions")
-        return True
-    
+
+    with _lock:
+        groups = _ensure_loaded()
+
+        if chat_id_str in groups:
+            del groups[chat_id_str]
+            try:
+                _append_log('remove', chat_id_str)
+            except Exception as e:
+                print(f"Error saving groups: {e}")
+            print(f"✅ Removed group {chat_id_str} from subscriptions")
+            return True
+
     print(f"ℹ️ Group {chat_id_str} not in subscriptions")
     return False
 
+
+def apply_changes(removed=(), migrated=None):
+    """
+    Apply a batch of removals and chat-id migrations in a single snapshot write.
+    Used after a broadcast to drop chats the bot was kicked from and to follow
+    group -> supergroup migrations.
+
+    Args:
+        removed (iterable): Chat IDs to unsubscribe
+        migrated (dict): Old chat ID -> new chat ID
+
+    Returns:
+        tuple: (number removed, number migrated)
+    """
+    migrated = migrated or {}
+
+    with _lock:
+        groups = _ensure_loaded()
+        removed_count = 0
+        migrated_count = 0
+
+        for old_id, new_id in migrated.items():
+            old_id, new_id = str(old_id), str(new_id)
+            if old_id in groups:
+                del groups[old_id]
+                groups[new_id] = True
+                migrated_count += 1
+
+        for chat_id in removed:
+            if groups.pop(str(chat_id), None):
+                removed_count += 1
+
+        if removed_count or migrated_count:
+            save_groups(list(groups))
+            print(f"🧹 Subscriptions updated: {removed_count} removed, {migrated_count} migrated")
+
+    return removed_count, migrated_count
+
+
+class ChangeBatch:
+    """Thread-safe collector for subscription changes found during a broadcast"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.removed = set()
+        self.migrated = {}
+
+    def remove(self, chat_id):
+        with self._lock:
+            self.removed.add(str(chat_id))
+
+    def migrate(self, old_chat_id, new_chat_id):
+        with self._lock:
+            self.migrated[str(old_chat_id)] = str(new_chat_id)
+
+    def apply(self):
+        """Write all collected changes to the store at once"""
+        with self._lock:
+            removed, migrated = set(self.removed), dict(self.migrated)
+        return apply_changes(removed, migrated)
+
+
 def get_all_groups():
     """Get all subscribed group IDs"""
     return load_groups()
 
+
 def get_group_count():
     """Get count of subscribed groups"""
-    return len(load_groups())
+    with _lock:
+        return len(_ensure_loaded())
+
 
 def is_subscribed(chat_id):
     """Check if a group is subscribed"""
-    return str(chat_id) in load_groups()
+    with _lock:
+        return str(chat_id) in _ensure_loaded()
+
+
+async def _run_async(func, *args):
+    """Run a store call on the store's thread pool and await the result"""
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        metrics.handler_registry.observe('store_op_seconds', time.perf_counter() - started, op=func.__name__)
+
+
+async def add_group_async(chat_id):
+    """add_group() without blocking the event loop"""
+    return await _run_async(add_group, chat_id)
+
+
+async def remove_group_async(chat_id):
+    """remove_group() without blocking the event loop"""
+    return await _run_async(remove_group, chat_id)
+
+
+async def get_group_count_async():
+    """get_group_count() without blocking the event loop"""
+    return await _run_async(get_group_count)
+
+
+async def is_subscribed_async(chat_id):
+    """is_subscribed() without blocking the event loop"""
+    return await _run_async(is_subscribed, chat_id)
@@ -0,0 +1,144 @@
+"""
+Command Handler Metrics
+Live latency and saturation metrics for the long-running command handler
+
+Every command is counted and timed, Bot API calls are timed per method (the
+getUpdates round trip separately), subscription store calls are timed per
+operation and a probe measures event-loop lag. The current values are served
+in Prometheus text format at http://METRICS_LISTEN:METRICS_PORT/metrics when
+METRICS_PORT is set, and dumped to METRICS_DIR/command_handler.json and .prom
+every METRICS_DUMP_SECONDS.
+"""
+
+import asyncio
+import os
+import time
+import group_manager
+import metrics
+
+METRICS_PORT = int(os.environ.get('METRICS_PORT', '0'))  # 0 = no HTTP endpoint
+METRICS_LISTEN = os.environ.get('METRICS_LISTEN', '127.0.0.1')
+METRICS_DUMP_SECONDS = float(os.environ.get('METRICS_DUMP_SECONDS', '60'))  # 0 = no periodic dump
+
+# How often the event-loop lag probe wakes up
+LAG_PROBE_SECONDS = 0.5
+# Name of the dump files in METRICS_DIR
+DUMP_NAME = "command_handler"
+
+registry = metrics.handler_registry
+
+_tasks = []
+_server = None
+
+
+def instrumented(command, callback):
+    """Wrap a command callback so every call is counted and timed"""
+    async def handler(update, context):
+        outcome = 'error'
+        started = time.perf_counter()
+        try:
+            result = await callback(update, context)
+            outcome = 'ok'
+            return result
+        finally:
+            registry.observe('command_seconds', time.perf_counter() - started, command=command)
+            registry.inc('commands_total', command=command, outcome=outcome)
+
+    return handler
+
+
+def observe_bot_api(endpoint, seconds):
+    """Record one Bot API call made by the Application"""
+    if endpoint == 'getUpdates':
+        registry.observe('polling_round_trip_seconds', seconds)
+    else:
+        registry.observe('bot_api_seconds', seconds, method=endpoint)
+
+
+def refresh_gauges():
+    """Update the gauges that are read rather than recorded"""
+    registry.set('subscribers', group_manager.get_group_count())
+
+
+def dump():
+    """Write the current metrics to METRICS_DIR"""
+    refresh_gauges()
+    header = {'name': DUMP_NAME, 'written_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+    return metrics.write_snapshot(DUMP_NAME, header, source=registry)
+
+
+async def watch_event_loop():
+    """Measure how late the loop wakes a sleeping task; blocked loops show up as lag"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + LAG_PROBE_SECONDS
+        await asyncio.sleep(LAG_PROBE_SECONDS)
+        registry.observe('event_loop_lag_seconds', max(0.0, loop.time() - expected))
+
+
+async def dump_periodically():
+    """Dump the metrics every METRICS_DUMP_SECONDS"""
+    while True:
+        await asyncio.sleep(METRICS_DUMP_SECONDS)
+        await asyncio.to_thread(dump)
+
+
+async def serve_metrics(reader, writer):
+    """Answer one HTTP request: GET /metrics returns the Prometheus text format"""
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+            pass
+
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            await asyncio.to_thread(refresh_gauges)
+            status, body = "200 OK", registry.prometheus().encode('utf-8')
+        else:
+            status, body = "404 Not Found", b"not found\n"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start():
+    """Start the lag probe, the periodic dump and the HTTP endpoint"""
+    global _server
+
+    _tasks.append(asyncio.create_task(watch_event_loop()))
+    if METRICS_DUMP_SECONDS > 0:
+        _tasks.append(asyncio.create_task(dump_periodically()))
+
+    if METRICS_PORT:
+        try:
+            _server = await asyncio.start_server(serve_metrics, METRICS_LISTEN, METRICS_PORT)
+            print(f"📈 Metrics at http://{METRICS_LISTEN}:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"⚠️ Could not start the metrics endpoint: {e}")
+
+
+async def stop():
+    """Stop the background tasks and endpoint, then write a final dump"""
+    global _server
+
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
+
+    if METRICS_DUMP_SECONDS > 0:
+        await asyncio.to_thread(dump)
@@ -0,0 +1,184 @@
+"""
+Image Buffer
+Report image held in a spooled temporary file and uploaded without copies
+
+The image is streamed into the buffer in chunks as it downloads; small
+images stay in memory and anything above IMAGE_SPOOL_MEMORY_BYTES spills to a
+temporary file, so peak memory does not grow with IMAGE_WIDTH/IMAGE_HEIGHT.
+MultipartBody feeds the buffer straight into a sendPhoto upload in chunks
+(requests would otherwise read the whole file into memory to encode it), and
+the same buffer is reused by every send, retry, cache write and artifact.
+Buffers that are replaced (a re-encoded original, a cancelled hedge) are
+closed right away so their temporary files do not wait for the GC.
+"""
+
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+
+# Largest image accepted (Telegram rejects photos above 10 MB)
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', str(10 * 1024 * 1024)))
+# Images up to this size stay in memory, larger ones spill to a temporary file
+IMAGE_SPOOL_MEMORY_BYTES = int(os.environ.get('IMAGE_SPOOL_MEMORY_BYTES', str(1024 * 1024)))
+# Read/write chunk size for downloads, copies and uploads
+IMAGE_CHUNK_BYTES = 64 * 1024
+
+# File name extension for each sniffed content type
+EXTENSIONS = {'image/png': 'png', 'image/jpeg': 'jpg', 'image/webp': 'webp'}
+
+
+class ImageTooLarge(ValueError):
+    """The image exceeds IMAGE_MAX_BYTES"""
+
+
+class ImageBuffer:
+    """
+    Write-once, read-many image storage.
+
+    Usage:
+        image = ImageBuffer()
+        for chunk in response.iter_content(IMAGE_CHUNK_BYTES):
+            image.write(chunk)
+        with image.reader() as f:
+            ...
+    """
+
+    def __init__(self, max_bytes=IMAGE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._file = SpooledTemporaryFile(max_size=IMAGE_SPOOL_MEMORY_BYTES)
+        # Readers share one file position, so they take turns
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_bytes(cls, data, max_bytes=IMAGE_MAX_BYTES):
+        image = cls(max_bytes)
+        image.write(data)
+        return image
+
+    @classmethod
+    def from_file(cls, path, max_bytes=IMAGE_MAX_BYTES):
+        """Copy a file into a new buffer in chunks"""
+        image = cls(max_bytes)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(IMAGE_CHUNK_BYTES), b''):
+                image.write(chunk)
+        return image
+
+    def __len__(self):
+        return self.size
+
+    def __bool__(self):
+        return self.size > 0
+
+    @property
+    def content_type(self):
+        """MIME type sniffed from the first bytes (image/png when unknown)"""
+        with self.reader() as f:
+            head = f.read(12)
+        if head.startswith(b'\xff\xd8'):
+            return 'image/jpeg'
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'image/webp'
+        return 'image/png'
+
+    def write(self, chunk):
+        """Append a chunk; raises ImageTooLarge past max_bytes"""
+        if self.max_bytes and self.size + len(chunk) > self.max_bytes:
+            raise ImageTooLarge(f"image exceeds {self.max_bytes:,} bytes")
+        with self._lock:
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(chunk)
+            self.size += len(chunk)
+
+    @contextmanager
+    def reader(self):
+        """The underlying file, rewound, for exclusive use inside the block"""
+        with self._lock:
+            self._file.seek(0)
+            yield self._file
+
+    def copy_to(self, f):
+        """Write the image into an open binary file"""
+        with self.reader() as source:
+            shutil.copyfileobj(source, f, IMAGE_CHUNK_BYTES)
+
+    def getvalue(self):
+        """The whole image as bytes (loads it into memory)"""
+        with self.reader() as source:
+            return source.read()
+
+    def close(self):
+        """Free the memory or temporary file (safe to call more than once)"""
+        self._file.close()
+
+
+def discard(image, keep=None):
+    """Close an ImageBuffer that is no longer needed, unless it is keep (None is ignored)"""
+    if image is not None and image is not keep:
+        image.close()
+
+
+class MultipartBody:
+    """
+    multipart/form-data request body that streams its files in chunks.
+
+    Pass as `data=` with the `Content-Type: body.content_type` header;
+    requests takes the Content-Length from len(body). Files are given like
+    requests' `files=`: {field: (filename, fileobj, content_type)}, and each
+    fileobj is rewound, so a new body can be built for every retry.
+    """
+
+    def __init__(self, fields, files):
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+
+        self._parts = []
+        for name, value in fields.items():
+            self._parts.append((
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f"{value}\r\n"
+            ).encode('utf-8'))
+        for name, (filename, fileobj, content_type) in files.items():
+            fileobj.seek(0, os.SEEK_END)
+            size = fileobj.tell()
+            fileobj.seek(0)
+            self._parts.append((
+                f"--{boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                f"Content-Type: {content_type}\r\n\r\n"
+            ).encode('utf-8'))
+            self._parts.append((fileobj, size))
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{boundary}--\r\n".encode('utf-8'))
+
+        self._length = sum(part[1] if isinstance(part, tuple) else len(part) for part in self._parts)
+        self._index = 0
+        self._offset = 0
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        """Read up to size bytes (everything if size < 0) across the parts"""
+        if size is None or size < 0:
+            size = self._length
+        out = []
+        while size > 0 and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if isinstance(part, tuple):
+                chunk = part[0].read(min(size, IMAGE_CHUNK_BYTES))
+            else:
+                chunk = part[self._offset:self._offset + size]
+                self._offset += len(chunk)
+            if not chunk:
+                self._index += 1
+                self._offset = 0
+                continue
+            out.append(chunk)
+            size -= len(chunk)
+        return b"".join(out)
@@ -0,0 +1,142 @@
+"""
+Image Cache
+Content-addressed on-disk cache for generated report images
+
+The image prompt carries a date seed, so the same URL always yields the same
+image for a given day. Reruns and manual workflow_dispatch runs can reuse the
+cached file instead of waiting on Pollinations again. The cache directory is
+size-bounded with least-recently-used eviction and can be persisted between
+GitHub Actions runs with actions/cache (see send_perplexity_report.yml).
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+
+IMAGE_CACHE_ENABLED = os.environ.get('IMAGE_CACHE_ENABLED', 'true').lower() != 'false'
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', '.image_cache')
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+
+_lock = threading.Lock()
+
+
+def cache_key(image_url, width, height, variant=""):
+    """Hash of the final prompt URL, dimensions and optional variant"""
+    raw = f"{image_url}|{width}x{height}|{variant}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _path(key):
+    return os.path.join(IMAGE_CACHE_DIR, f"{key}.img")
+
+
+def load_image(key):
+    """
+    Get cached image bytes for key.
+
+    Returns:
+        bytes: The cached image, or None on a miss
+    """
+    if not IMAGE_CACHE_ENABLED:
+        return None
+
+    path = _path(key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Touch the file so eviction treats it as recently used
+        os.utime(path, None)
+        return data or None
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"⚠️ Image cache read failed: {e}")
+        return None
+
+
+def image_path(key):
+    """
+    Path of the cached image for key, so it can be streamed instead of read.
+
+    Returns:
+        str: Path of the cached file, or None on a miss
+    """
+    if not IMAGE_CACHE_ENABLED:
+        return None
+
+    path = _path(key)
+    try:
+        if os.path.getsize(path) == 0:
+            return None
+        os.utime(path, None)
+        return path
+    except OSError:
+        return None
+
+
+def store_image(key, data):
+    """Atomically write image bytes for key, then enforce the size bound"""
+    if not data:
+        return False
+    return store_file(key, lambda f: f.write(data))
+
+
+def store_file(key, write):
+    """
+    Atomically store an image for key, then enforce the size bound.
+    write(f) writes the image into the open binary file f.
+    """
+    if not IMAGE_CACHE_ENABLED:
+        return False
+
+    try:
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".img-", suffix=".tmp", dir=IMAGE_CACHE_DIR)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, _path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    except OSError as e:
+        print(f"⚠️ Image cache write failed: {e}")
+        return False
+
+    evict()
+    return True
+
+
+def evict(max_bytes=None):
+    """Delete least-recently-used images until the cache fits in max_bytes"""
+    max_bytes = IMAGE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    with _lock:
+        try:
+            entries = []
+            for name in os.listdir(IMAGE_CACHE_DIR):
+                if not name.endswith('.img'):
+                    continue
+                path = os.path.join(IMAGE_CACHE_DIR, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        except OSError:
+            return 0
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+
+        if removed:
+            print(f"🧹 Evicted {removed} image(s) from cache")
+        return removed
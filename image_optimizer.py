@@ -0,0 +1,131 @@
+"""
+Image Optimizer
+Re-encodes the report image to a compact JPEG or WebP before upload
+
+Pollinations returns a full-size PNG, and Telegram recompresses photos
+anyway, so the upload is re-encoded to IMAGE_OPTIMIZE_FORMAT at the highest
+quality that fits IMAGE_TARGET_BYTES. If even the lowest quality does not
+fit, the image is downscaled step by step. Optional: only runs with
+IMAGE_OPTIMIZE=true and Pillow installed, otherwise (or if the re-encode
+fails) images are sent unchanged.
+"""
+
+import os
+from io import BytesIO
+from image_buffer import ImageBuffer
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_OPTIMIZE = os.environ.get('IMAGE_OPTIMIZE', 'false').lower() == 'true'
+IMAGE_OPTIMIZE_FORMAT = os.environ.get('IMAGE_OPTIMIZE_FORMAT', 'JPEG').upper()  # JPEG or WEBP
+IMAGE_TARGET_BYTES = int(os.environ.get('IMAGE_TARGET_BYTES', '200000'))
+IMAGE_MAX_DIMENSION = int(os.environ.get('IMAGE_MAX_DIMENSION', '1280'))  # longest side, pixels
+
+# Quality search range and downscaling limits
+MIN_QUALITY = 45
+MAX_QUALITY = 90
+SCALE_STEP = 0.8
+MIN_DIMENSION = 320
+
+FORMATS = ('JPEG', 'WEBP')
+
+
+def enabled():
+    """True when optimization is switched on and Pillow is installed"""
+    return IMAGE_OPTIMIZE and Image is not None and IMAGE_OPTIMIZE_FORMAT in FORMATS
+
+
+def variant():
+    """Image cache variant of optimized images ('' when optimization is off)"""
+    if not enabled():
+        return ""
+    return f"{IMAGE_OPTIMIZE_FORMAT.lower()}-{IMAGE_TARGET_BYTES}-{IMAGE_MAX_DIMENSION}"
+
+
+def _encode(image, quality):
+    out = BytesIO()
+    image.save(out, format=IMAGE_OPTIMIZE_FORMAT, quality=quality, optimize=True)
+    return out.getvalue()
+
+
+def _best_quality(image):
+    """
+    Binary-search the highest quality that fits IMAGE_TARGET_BYTES.
+
+    Returns:
+        bytes: The encoded image, or the lowest-quality encoding if none fits
+    """
+    low, high = MIN_QUALITY, MAX_QUALITY
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(image, quality)
+        if len(data) <= IMAGE_TARGET_BYTES:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best or _encode(image, MIN_QUALITY)
+
+
+def _reencode(picture):
+    """
+    Convert, downscale and encode a decoded picture within the byte budget.
+
+    Returns:
+        tuple: (final picture, encoded bytes)
+    """
+    # JPEG has no alpha channel; WebP keeps it
+    if picture.mode not in ('RGB', 'RGBA') or (picture.mode == 'RGBA' and IMAGE_OPTIMIZE_FORMAT == 'JPEG'):
+        picture = picture.convert('RGB')
+
+    if max(picture.size) > IMAGE_MAX_DIMENSION:
+        picture.thumbnail((IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION), Image.LANCZOS)
+
+    data = _best_quality(picture)
+    while len(data) > IMAGE_TARGET_BYTES and max(picture.size) * SCALE_STEP >= MIN_DIMENSION:
+        size = (int(picture.width * SCALE_STEP), int(picture.height * SCALE_STEP))
+        picture = picture.resize(size, Image.LANCZOS)
+        data = _best_quality(picture)
+    return picture, data
+
+
+def optimize(image):
+    """
+    Re-encode an ImageBuffer within the byte budget.
+
+    Returns:
+        ImageBuffer: The smaller image, or the original if optimization is off,
+        fails or does not save anything
+    """
+    if not enabled() or not image:
+        return image
+
+    try:
+        with image.reader() as f:
+            picture = Image.open(f)
+            picture.load()
+    except Exception as e:
+        print(f"⚠️ Image optimization skipped, could not decode image: {e}")
+        return image
+
+    # Already within budget (e.g. a pooled image optimized on an earlier run)
+    if image.size <= IMAGE_TARGET_BYTES and max(picture.size) <= IMAGE_MAX_DIMENSION:
+        return image
+
+    try:
+        picture, data = _reencode(picture)
+    except Exception as e:
+        print(f"⚠️ Image optimization failed, keeping the original: {e}")
+        return image
+
+    if len(data) >= image.size:
+        print(f"ℹ️ Re-encoding would not shrink the image ({image.size:,} bytes), keeping it")
+        return image
+
+    print(f"🗜️ Image re-encoded as {IMAGE_OPTIMIZE_FORMAT} {picture.width}x{picture.height}: "
+          f"{image.size:,} → {len(data):,} bytes")
+    return ImageBuffer.from_bytes(data)
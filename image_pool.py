@@ -0,0 +1,84 @@
+"""
+Image Pool
+Local fallback images for when no generated image arrives in time
+
+Every generated report image is also kept in IMAGE_POOL_DIR (the newest
+IMAGE_POOL_SIZE of them), and images placed there by hand are kept forever.
+When image generation fails or misses its budget, the report is posted with
+an image from the pool instead of degrading to text-only. The pool is
+restored between GitHub Actions runs with actions/cache.
+"""
+
+import os
+import tempfile
+from datetime import datetime
+from image_buffer import ImageBuffer, EXTENSIONS
+
+IMAGE_POOL_DIR = os.environ.get('IMAGE_POOL_DIR', 'image_pool')
+IMAGE_POOL_SIZE = int(os.environ.get('IMAGE_POOL_SIZE', '10'))
+
+# Generated images are named generated-YYYYMMDD.<ext>; anything else is hand-placed
+GENERATED_PREFIX = "generated-"
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+def _images():
+    try:
+        return sorted(
+            name for name in os.listdir(IMAGE_POOL_DIR)
+            if name.lower().endswith(IMAGE_SUFFIXES)
+        )
+    except FileNotFoundError:
+        return []
+
+
+def add(image, date=None):
+    """Keep a generated image as a future fallback, pruning the oldest beyond IMAGE_POOL_SIZE"""
+    if not image or IMAGE_POOL_SIZE <= 0:
+        return False
+
+    date = date or datetime.utcnow().strftime('%Y%m%d')
+    name = f"{GENERATED_PREFIX}{date}.{EXTENSIONS[image.content_type]}"
+    tmp_path = None
+    try:
+        os.makedirs(IMAGE_POOL_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".pool-", suffix=".tmp", dir=IMAGE_POOL_DIR)
+        with os.fdopen(fd, 'wb') as f:
+            image.copy_to(f)
+        for existing in _images():
+            if existing.startswith(f"{GENERATED_PREFIX}{date}."):
+                os.remove(os.path.join(IMAGE_POOL_DIR, existing))
+        os.replace(tmp_path, os.path.join(IMAGE_POOL_DIR, name))
+
+        generated = [existing for existing in _images() if existing.startswith(GENERATED_PREFIX)]
+        for old in generated[:-IMAGE_POOL_SIZE]:
+            os.remove(os.path.join(IMAGE_POOL_DIR, old))
+    except OSError as e:
+        print(f"⚠️ Could not add image to the fallback pool: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    return True
+
+
+def pick(date=None):
+    """
+    Choose a fallback image, rotating through the pool by day.
+
+    Returns:
+        ImageBuffer: A pooled image, or None if the pool is empty
+    """
+    images = _images()
+    if not images:
+        return None
+
+    date = date or datetime.utcnow()
+    name = images[date.toordinal() % len(images)]
+    try:
+        image = ImageBuffer.from_file(os.path.join(IMAGE_POOL_DIR, name))
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not read fallback image {name}: {e}")
+        return None
+
+    print(f"🖼️ Using fallback image {name} from the pool")
+    return image
@@ -0,0 +1,188 @@
+"""
+Image Providers
+Hedged image generation across seeds and providers, first response wins
+
+The report image is requested from IMAGE_API_URL first. If it has not
+arrived after IMAGE_HEDGE_AFTER_SECONDS (or the request fails), a hedge is
+sent to the next candidate: each provider in IMAGE_PROVIDER_URLS with the
+same prompt, then IMAGE_API_URL again with an alternate seed. The first
+image to finish downloading is used and the slower requests are cancelled:
+their open responses are closed, and requests still waiting for headers run
+on daemon threads, so they never hold up the end of the run.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from urllib.parse import quote
+
+import metrics
+
+# Alternate providers tried after IMAGE_API_URL, comma separated. A plain URL is
+# used like Pollinations (prompt appended to the path); a URL containing
+# {prompt}, {width} and {height} placeholders is filled in instead.
+IMAGE_PROVIDER_URLS = [url.strip() for url in os.environ.get('IMAGE_PROVIDER_URLS', '').split(',') if url.strip()]
+IMAGE_HEDGE_AFTER_SECONDS = float(os.environ.get('IMAGE_HEDGE_AFTER_SECONDS', '20'))
+IMAGE_MAX_HEDGES = int(os.environ.get('IMAGE_MAX_HEDGES', '2'))  # extra requests on top of the first
+
+
+class ImageProvider:
+    """An image generation endpoint that turns a prompt into an image URL"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    @property
+    def name(self):
+        return self.base_url.split('://', 1)[-1].split('/', 1)[0]
+
+    def url(self, prompt, width, height):
+        if '{prompt}' in self.base_url:
+            return self.base_url.format(prompt=quote(prompt), width=width, height=height)
+        return (
+            f"{self.base_url}{quote(prompt)}"
+            f"?width={width}"
+            f"&height={height}"
+            f"&nologo=true"
+            f"&enhance=true"
+        )
+
+
+class Cancellation:
+    """
+    Cancel flag shared by the racing requests.
+    Closers registered with on_cancel (e.g. Response.close) run once the race
+    is decided, so losers stop without waiting for their next chunk.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._closers = []
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def on_cancel(self, closer):
+        """Run closer when cancelled (right away if already cancelled)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._closers.append(closer)
+                return
+        closer()
+
+    def discard(self, closer):
+        with self._lock:
+            if closer in self._closers:
+                self._closers.remove(closer)
+
+    def set(self):
+        with self._lock:
+            self._event.set()
+            closers, self._closers = self._closers, []
+        for closer in closers:
+            try:
+                closer()
+            except Exception:
+                pass
+
+
+def _submit(fetch, *args):
+    """Run fetch on a daemon thread, so an abandoned request never blocks exit"""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fetch(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="image-hedge", daemon=True).start()
+    return future
+
+
+def _discard(future):
+    """Close the result of a request that lost the race"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), 'close', None)
+    if close is not None:
+        close()
+
+
+def candidate_urls(primary_url, prompt, seed, width, height):
+    """
+    Image URLs in the order they are tried: the primary provider, each
+    alternate provider, then the primary provider with alternate seeds.
+    At most 1 + IMAGE_MAX_HEDGES URLs are returned.
+    """
+    primary = ImageProvider(primary_url)
+    alternates = [ImageProvider(url) for url in IMAGE_PROVIDER_URLS]
+
+    urls = [primary.url(f"{prompt}, seed {seed}", width, height)]
+    urls += [provider.url(f"{prompt}, seed {seed}", width, height) for provider in alternates]
+    for attempt in range(1, IMAGE_MAX_HEDGES + 1):
+        urls.append(primary.url(f"{prompt}, seed {seed}-{attempt}", width, height))
+    return urls[:1 + max(0, IMAGE_MAX_HEDGES)]
+
+
+def race(urls, fetch, timeout, hedge_after=None):
+    """
+    Fetch urls[0], hedging with the next URL whenever the running requests
+    take longer than hedge_after seconds or one of them fails.
+
+    fetch(url, timeout, cancel) returns the result, or None on failure, and
+    should give up once cancel (a Cancellation) is set, registering its open
+    response with cancel.on_cancel so it can be closed.
+
+    Returns:
+        tuple: (url, result) of the first successful fetch, or (None, None)
+    """
+    hedge_after = IMAGE_HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+    deadline = time.monotonic() + timeout
+    cancel = Cancellation()
+    queue = list(urls)
+    pending = {}
+
+    def launch():
+        url = queue.pop(0)
+        if pending:
+            print(f"🏁 Image still pending, hedging with another request")
+            metrics.inc('image_hedges_total')
+        pending[_submit(fetch, url, max(1.0, deadline - time.monotonic()), cancel)] = url
+
+    try:
+        launch()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print("⏰ No image arrived within the image budget")
+                break
+
+            done, _ = wait(pending, timeout=min(remaining, hedge_after) if queue else remaining,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ Image request failed: {e}")
+                    result = None
+                if result:
+                    return url, result
+
+            # Slow or failed so far: start the next candidate
+            if queue:
+                launch()
+
+        return None, None
+
+    finally:
+        # Close the losers' responses; requests still waiting for headers
+        # finish on their daemon threads and whatever they return is closed
+        cancel.set()
+        for future in pending:
+            future.add_done_callback(_discard)
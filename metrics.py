@@ -0,0 +1,282 @@
+"""
+Metrics
+Counters, gauges and timing histograms with JSON and Prometheus export
+
+bot.py records the wall time of every pipeline stage (Perplexity attempts,
+image download, each Telegram send), retries, HTTP status counts and bytes
+transferred (transport.py counts every request). At the end of a run,
+write_run_report() saves a JSON run report and a Prometheus text-format file
+named after the run mode to METRICS_DIR, ready to upload as a workflow
+artifact.
+"""
+
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+METRICS_DIR = os.environ.get('METRICS_DIR', 'metrics')
+METRICS_NAMESPACE = "crypto_bot"
+
+# Histogram bucket bounds in seconds (Prometheus 'le' labels)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Samples kept per timing series for exact percentiles in the JSON report
+MAX_SAMPLES = 10000
+
+# HELP text for the metrics the report pipeline records
+DESCRIPTIONS = {
+    'stage_seconds': "Wall time of each report pipeline stage",
+    'perplexity_attempt_seconds': "Wall time of each Perplexity request attempt",
+    'image_download_seconds': "Wall time of the image download",
+    'image_cache_total': "Image cache lookups by result",
+    'image_hedges_total': "Hedged image requests sent because the first was slow or failed",
+    'image_fallback_total': "Reports sent with an image from the local fallback pool",
+    'telegram_send_seconds': "Wall time of each Telegram send, including rate-limit waits and retries",
+    'deliveries_total': "Report deliveries by result",
+    'retries_total': "Retried requests by upstream",
+    'http_request_seconds': "Wall time of each HTTP request by host",
+    'http_responses_total': "HTTP responses by host and status (or exception class)",
+    'http_bytes_sent_total': "Request body bytes sent by host",
+    'http_bytes_received_total': "Response body bytes received by host",
+    'run_success': "1 if the last run succeeded, 0 otherwise",
+    'run_duration_seconds': "Wall time of the last run",
+    'run_finished_timestamp_seconds': "Unix time the last run finished",
+    'commands_total': "Commands handled by command and outcome",
+    'command_seconds': "Wall time of each command handler, including its reply",
+    'bot_api_seconds': "Wall time of each Bot API call by method, including rate-limit waits",
+    'polling_round_trip_seconds': "Wall time of each getUpdates call, including the long-poll wait",
+    'store_op_seconds': "Wall time of each subscription store call, including thread pool queueing",
+    'event_loop_lag_seconds': "How late the event loop ran a scheduled probe",
+    'subscribers': "Subscribed groups",
+}
+
+
+class Timing:
+    """Histogram of durations, plus a bounded random sample for percentiles"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def observe(self, seconds):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+        # Reservoir sampling keeps memory flat for long-lived processes
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(seconds)
+        else:
+            slot = random.randrange(self.count)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = seconds
+
+    def percentile(self, pct):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        rank = max(1, int(round(pct / 100.0 * len(ordered))))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'p50': round(self.percentile(50), 6),
+            'p95': round(self.percentile(95), 6),
+            'p99': round(self.percentile(99), 6),
+            'max': round(self.max, 6),
+        }
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Registry:
+    """Thread-safe store for every metric series in the process"""
+
+    def __init__(self, namespace=METRICS_NAMESPACE):
+        self.namespace = namespace
+        self.descriptions = dict(DESCRIPTIONS)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.counters = {}
+            self.gauges = {}
+            self.timings = {}
+
+    def describe(self, name, text):
+        """Set the HELP text for a metric"""
+        with self._lock:
+            self.descriptions[name] = text
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge"""
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = Timing()
+            timing.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the enclosed block (recorded even if it raises)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """All series as plain data for the JSON report"""
+        with self._lock:
+            def series(items, render):
+                grouped = {}
+                for (name, labels), value in sorted(items):
+                    grouped.setdefault(name, []).append({'labels': dict(labels), 'value': render(value)})
+                return grouped
+
+            return {
+                'counters': series(self.counters.items(), lambda value: value),
+                'gauges': series(self.gauges.items(), lambda value: value),
+                'timings': series(self.timings.items(), lambda timing: timing.summary()),
+            }
+
+    def prometheus(self):
+        """All series in Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            def header(name, kind):
+                full_name = f"{self.namespace}_{name}"
+                if name in self.descriptions:
+                    lines.append(f"# HELP {full_name} {self.descriptions[name]}")
+                lines.append(f"# TYPE {full_name} {kind}")
+                return full_name
+
+            for kind, store in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in store}):
+                    full_name = header(name, kind)
+                    for (series_name, labels), value in sorted(store.items()):
+                        if series_name == name:
+                            lines.append(f"{full_name}{_format_labels(labels)} {value}")
+
+            for name in sorted({name for name, _ in self.timings}):
+                full_name = header(name, 'histogram')
+                for (series_name, labels), timing in sorted(self.timings.items()):
+                    if series_name != name:
+                        continue
+                    for bound, count in zip(timing.buckets, timing.bucket_counts):
+                        lines.append(f"{full_name}_bucket{_format_labels(labels, [('le', str(bound))])} {count}")
+                    lines.append(f"{full_name}_bucket{_format_labels(labels, [('le', '+Inf')])} {timing.count}")
+                    lines.append(f"{full_name}_sum{_format_labels(labels)} {timing.sum}")
+                    lines.append(f"{full_name}_count{_format_labels(labels)} {timing.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Live metrics of the long-running command handler (handler_metrics.py);
+# kept apart so the per-run reset in service.py does not clear them
+handler_registry = Registry()
+
+inc = registry.inc
+set_gauge = registry.set
+observe = registry.observe
+timer = registry.timer
+describe = registry.describe
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics.", suffix=".tmp")
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_run_report(mode, success, **details):
+    """
+    Save the metrics of the finished run as METRICS_DIR/<mode>.json and
+    METRICS_DIR/<mode>.prom.
+
+    Returns:
+        str: Path of the JSON report, or None if it could not be written
+    """
+    finished_at = time.time()
+    registry.set('run_success', 1 if success else 0, mode=mode)
+    registry.set('run_duration_seconds', round(finished_at - registry.started_at, 3), mode=mode)
+    registry.set('run_finished_timestamp_seconds', round(finished_at, 3), mode=mode)
+
+    report = {
+        'mode': mode,
+        'success': bool(success),
+        'started_at': datetime.utcfromtimestamp(registry.started_at).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'finished_at': datetime.utcfromtimestamp(finished_at).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'duration_seconds': round(finished_at - registry.started_at, 3),
+        'details': details,
+    }
+    json_path = write_snapshot(mode, report)
+    if json_path:
+        print(f"📈 Run metrics written to {METRICS_DIR}/")
+    return json_path
+
+
+def write_snapshot(name, header=None, source=registry):
+    """
+    Save every series of source as METRICS_DIR/<name>.json (header fields
+    first) and METRICS_DIR/<name>.prom.
+
+    Returns:
+        str: Path of the JSON file, or None if it could not be written
+    """
+    data = dict(header or {})
+    data.update(source.snapshot())
+
+    json_path = os.path.join(METRICS_DIR, f"{name}.json")
+    try:
+        _write_atomic(json_path, json.dumps(data, indent=2))
+        _write_atomic(os.path.join(METRICS_DIR, f"{name}.prom"), source.prometheus())
+    except OSError as e:
+        print(f"⚠️ Could not write metrics: {e}")
+        return None
+    return json_path
@@ -0,0 +1,152 @@
+"""
+Telegram Rate Limiter
+Shared token buckets for every Telegram Bot API call we make
+
+One global bucket keeps the bot below Telegram's ~30 messages/second limit.
+Each chat gets its own bucket on top of that: about one message per second
+for private chats, and about 20 messages per minute for groups. When Telegram
+answers 429 with retry_after, the chat and the whole bot are paused for that
+long, so the next sends back off instead of earning a flood ban.
+
+The limiter only computes how long a caller must wait. acquire() sleeps a
+thread (bot.py's broadcast workers) and acquire_async() awaits on the event
+loop (command_handler.py), so both share the same accounting in one process.
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+TELEGRAM_GLOBAL_RATE = float(os.environ.get('BROADCAST_GLOBAL_RATE', '25'))  # messages/second
+TELEGRAM_GLOBAL_BURST = float(os.environ.get('TELEGRAM_GLOBAL_BURST', '25'))
+TELEGRAM_PER_CHAT_INTERVAL = float(os.environ.get('BROADCAST_PER_CHAT_INTERVAL', '1.0'))  # seconds
+TELEGRAM_GROUP_PER_MINUTE = float(os.environ.get('TELEGRAM_GROUP_PER_MINUTE', '20'))
+TELEGRAM_MAX_RETRIES = int(os.environ.get('TELEGRAM_MAX_RETRIES', '3'))
+
+# Per-chat buckets idle for this long are dropped to keep memory flat
+_IDLE_BUCKET_SECONDS = 120
+
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations.
+    Tokens may go negative; the debt is how long the caller has to wait.
+    Not thread-safe on its own; RateLimiter serializes access.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, now):
+        """Take one token, returning seconds until it is actually available"""
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """Global plus per-chat token buckets with 429 retry_after feedback"""
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, global_burst=TELEGRAM_GLOBAL_BURST,
+                 per_chat_interval=TELEGRAM_PER_CHAT_INTERVAL, group_per_minute=TELEGRAM_GROUP_PER_MINUTE):
+        self.per_chat_interval = per_chat_interval
+        self.group_per_minute = group_per_minute
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}
+        self._paused_until = 0.0
+        self._chat_paused_until = {}
+        self._last_cleanup = time.monotonic()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if chat_id.startswith('-'):
+                # Groups: ~20 messages/minute, at most a short burst at once
+                bucket = TokenBucket(self.group_per_minute / 60.0, 3)
+            else:
+                bucket = TokenBucket(1.0 / self.per_chat_interval if self.per_chat_interval > 0 else 0, 1)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _cleanup(self, now):
+        if now - self._last_cleanup < _IDLE_BUCKET_SECONDS:
+            return
+        self._last_cleanup = now
+        idle = [chat_id for chat_id, bucket in self._chats.items()
+                if now - bucket.updated > _IDLE_BUCKET_SECONDS]
+        for chat_id in idle:
+            del self._chats[chat_id]
+            self._chat_paused_until.pop(chat_id, None)
+
+    def reserve(self, chat_id=None):
+        """
+        Reserve a send slot.
+
+        Returns:
+            float: Seconds the caller must wait before sending
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._cleanup(now)
+
+            wait = max(0.0, self._paused_until - now)
+            if chat_id is not None:
+                chat_id = str(chat_id)
+                wait = max(wait, self._chat_paused_until.get(chat_id, 0.0) - now)
+                wait = max(wait, self._chat_bucket(chat_id).reserve(now))
+            wait = max(wait, self._global.reserve(now))
+            return wait
+
+    def acquire(self, chat_id=None):
+        """Block the current thread until a message to chat_id may be sent"""
+        wait = self.reserve(chat_id)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, chat_id=None):
+        """Wait on the event loop until a message to chat_id may be sent"""
+        wait = self.reserve(chat_id)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_retry_after(self, chat_id, retry_after):
+        """Feed a 429 retry_after back into the limiter"""
+        with self._lock:
+            until = time.monotonic() + max(0.0, float(retry_after))
+            self._paused_until = max(self._paused_until, until)
+            if chat_id is not None:
+                chat_id = str(chat_id)
+                self._chat_paused_until[chat_id] = max(self._chat_paused_until.get(chat_id, 0.0), until)
+        print(f"🚦 Telegram asked to slow down: pausing sends for {float(retry_after):.0f}s")
+
+
+limiter = RateLimiter()
+
+
+def set_global_rate(rate):
+    """Change the global send rate (e.g. to a share of it when running as one of N shards)"""
+    global limiter
+    limiter = RateLimiter(global_rate=rate, global_burst=min(TELEGRAM_GLOBAL_BURST, max(1.0, rate)))
+
+
+def acquire(chat_id=None):
+    """Block until the shared limiter allows a send to chat_id"""
+    limiter.acquire(chat_id)
+
+
+async def acquire_async(chat_id=None):
+    """Await until the shared limiter allows a send to chat_id"""
+    await limiter.acquire_async(chat_id)
+
+
+def on_retry_after(chat_id, retry_after):
+    """Report a 429 retry_after to the shared limiter"""
+    limiter.on_retry_after(chat_id, retry_after)
@@ -0,0 +1,127 @@
+"""
+Report Cache
+Persists the last generated report so it can be served on demand
+
+bot.py saves every report it generates (text, image URL, image cache key and
+the Telegram file_id once known). command_handler.py serves /latest from here
+and only asks Perplexity again once the entry is older than REPORT_CACHE_TTL.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+import image_cache
+
+REPORT_CACHE_FILE = os.environ.get('REPORT_CACHE_FILE', 'report_cache.json')
+REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', '3600'))  # seconds
+
+_lock = threading.Lock()
+_memory = None        # last entry read or written by this process
+_memory_mtime = None  # mtime of REPORT_CACHE_FILE when _memory was loaded
+
+
+def _write(entry):
+    """Atomically write entry to REPORT_CACHE_FILE"""
+    global _memory, _memory_mtime
+
+    directory = os.path.dirname(os.path.abspath(REPORT_CACHE_FILE))
+    fd, tmp_path = tempfile.mkstemp(prefix=".report-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f, indent=2)
+        os.replace(tmp_path, REPORT_CACHE_FILE)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    _memory = entry
+    _memory_mtime = os.path.getmtime(REPORT_CACHE_FILE)
+
+
+def save_report(content, image_url=None, image_key=None, file_id=None):
+    """
+    Store a freshly generated report.
+
+    Returns:
+        dict: The stored entry, or None if it could not be written
+    """
+    entry = {
+        'content': content,
+        'image_url': image_url,
+        'image_key': image_key,
+        'file_id': file_id,
+        'generated_at': time.time(),
+    }
+
+    with _lock:
+        try:
+            _write(entry)
+            print(f"💾 Report cached ({len(content)} chars)")
+            return entry
+        except Exception as e:
+            print(f"⚠️ Could not cache report: {e}")
+            return None
+
+
+def update_file_id(file_id):
+    """Remember the Telegram file_id of the cached report's photo"""
+    with _lock:
+        entry = _load()
+        if not entry or not file_id or entry.get('file_id') == file_id:
+            return False
+        try:
+            _write(dict(entry, file_id=file_id))
+            return True
+        except Exception as e:
+            print(f"⚠️ Could not update cached report: {e}")
+            return False
+
+
+def _load():
+    """Return the cached entry, re-reading the file only if it changed"""
+    global _memory, _memory_mtime
+
+    try:
+        mtime = os.path.getmtime(REPORT_CACHE_FILE)
+    except OSError:
+        return _memory
+
+    if _memory is None or mtime != _memory_mtime:
+        try:
+            with open(REPORT_CACHE_FILE, 'r') as f:
+                data = json.load(f)
+            _memory = data if isinstance(data, dict) and data.get('content') else None
+            _memory_mtime = mtime
+        except Exception as e:
+            print(f"Error loading cached report: {e}")
+            return _memory
+
+    return _memory
+
+
+def load_report():
+    """Get the cached report entry (fresh or not), or None"""
+    with _lock:
+        return _load()
+
+
+def report_age(entry):
+    """Seconds since the entry was generated"""
+    return time.time() - entry.get('generated_at', 0)
+
+
+def is_fresh(entry, ttl=None):
+    """Check whether an entry is younger than the TTL"""
+    ttl = REPORT_CACHE_TTL if ttl is None else ttl
+    return entry is not None and report_age(entry) < ttl
+
+
+def load_image(entry):
+    """Get the cached image bytes for a report entry, if still on disk"""
+    if not entry or not entry.get('image_key'):
+        return None
+    return image_cache.load_image(entry['image_key'])
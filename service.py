@@ -0,0 +1,162 @@
+"""
+Crypto Market Daily Service
+Runs the command handler and the daily report in one long-lived process
+
+The command handler Application polls Telegram as usual, and PTB's JobQueue
+schedules the report pipeline in-process: the report is staged (see
+staged_report.py) REPORT_PRECOMPUTE_MINUTES before REPORT_TIME_UTC and
+broadcast on time. The report shares the process's rate limiter and the
+live subscription set with command replies, so groups that subscribed a
+minute ago get today's report. Report sends go through transport.py's
+pooled sessions, which stay warm between reports; PTB keeps its own
+connection pool for command replies.
+
+The service has to run for days, so on GitHub Actions it needs a
+self-hosted runner: GitHub-hosted jobs are stopped after 6 hours.
+"""
+
+import asyncio
+import os
+import sys
+from datetime import date, datetime, timedelta
+import bot as report_bot
+import command_handler
+import deadline
+import delivery_ledger
+import group_manager
+import metrics
+import staged_report
+import transport
+
+REPORT_PRECOMPUTE_MINUTES = int(os.environ.get('REPORT_PRECOMPUTE_MINUTES', '15'))
+# JobQueue day numbers: 0 = Sunday ... 6 = Saturday
+REPORT_DAYS = tuple(int(day) for day in os.environ.get('REPORT_DAYS', '1,2,3,4,5').split(','))
+
+
+def precompute_schedule(send_time, days, minutes):
+    """
+    Time and days for the precompute job, minutes before each send.
+    If that crosses midnight, the precompute runs on the previous day.
+    """
+    start = datetime.combine(date(2000, 1, 3), send_time) - timedelta(minutes=minutes)
+    if start.day != 3:
+        days = tuple((day - 1) % 7 for day in days)
+    return start.timetz(), days
+
+
+# ============================================================================
+# REPORT JOBS
+# ============================================================================
+
+async def precompute_report(context):
+    """Stage today's report ahead of the send time"""
+    print(f"\n⏳ Precomputing today's report ({REPORT_PRECOMPUTE_MINUTES} min ahead)")
+    try:
+        staged = await asyncio.to_thread(report_bot.stage_report)
+    except Exception as e:
+        print(f"❌ Precompute failed: {e}")
+        staged = None
+
+    if staged:
+        print("✅ Report staged for delivery")
+    else:
+        print("⚠️ Precompute failed, will retry at send time")
+
+
+def run_report():
+    """
+    Deliver the daily report from a worker thread.
+    Uses the staged report, falling back to generating one when nothing was staged.
+
+    Returns:
+        bool: True if at least one chat received the report
+    """
+    run_budget = deadline.run_deadline()
+    ledger = delivery_ledger.DeliveryLedger()
+    report = report_bot.release_report(ledger, run_budget)
+
+    if not report:
+        report_bot.notify_report_failed()
+        return False
+
+    return report_bot.deliver_to_all(report, run_budget, ledger)
+
+
+async def send_report(context):
+    """Broadcast the staged report at the scheduled time"""
+    success = False
+    try:
+        success = await asyncio.to_thread(run_report)
+    except Exception as e:
+        print(f"❌ Scheduled report failed: {e}")
+    finally:
+        # One run report per scheduled send, then start counting afresh
+        metrics.write_run_report('service', success)
+        metrics.registry.reset()
+
+
+def schedule_report(app):
+    """Register the precompute and send jobs on the Application's JobQueue"""
+    send_time = staged_report.parse_report_time(staged_report.REPORT_TIME_UTC)
+    precompute_time, precompute_days = precompute_schedule(send_time, REPORT_DAYS, REPORT_PRECOMPUTE_MINUTES)
+
+    app.job_queue.run_daily(precompute_report, precompute_time, days=precompute_days, name="precompute-report")
+    app.job_queue.run_daily(send_report, send_time, days=REPORT_DAYS, name="send-report")
+
+    print(f"⏰ Report scheduled at {send_time.strftime('%H:%M')} UTC "
+          f"(precompute at {precompute_time.strftime('%H:%M')} UTC, days {REPORT_DAYS})")
+
+
+# ============================================================================
+# MAIN FUNCTION
+# ============================================================================
+
+def main():
+    """Run the command handler with the daily report scheduled in-process"""
+    print("\n" + "=" * 60)
+    print("🤖 CRYPTO MARKET DAILY - SERVICE")
+    print("=" * 60)
+
+    is_valid, missing_vars = report_bot.validate_environment()
+    if not is_valid:
+        print("\n❌ ERROR: Missing required variables!")
+        for var in missing_vars:
+            print(f"   - {var}")
+        sys.exit(1)
+
+    if os.environ.get('RUNNER_ENVIRONMENT') == 'github-hosted':
+        # The job would be killed within 6 hours and most reports never sent
+        print("\n❌ ERROR: The service needs a self-hosted runner (GitHub-hosted jobs stop after 6 hours)")
+        sys.exit(1)
+
+    report_bot.print_config_status()
+    print(f"Subscribed groups: {group_manager.get_group_count()}")
+    print("=" * 60 + "\n")
+
+    app = command_handler.build_application(refresh_latest=True)
+    if app.job_queue is None:
+        print("❌ ERROR: JobQueue unavailable, install python-telegram-bot[job-queue]")
+        sys.exit(1)
+
+    try:
+        schedule_report(app)
+    except ValueError as e:
+        print(f"❌ ERROR: {e}")
+        sys.exit(1)
+
+    print("✅ Service is running...")
+    print("📝 Listening for commands and waiting for the next report...\n")
+
+    try:
+        command_handler.run_application(app)
+    except KeyboardInterrupt:
+        print("\n⚠️ Service stopped by user")
+    except Exception as e:
+        print(f"\n❌ Error: {e}")
+        sys.exit(1)
+    finally:
+        transport.close_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Sharded Delivery
+Splits the daily broadcast across several processes or GitHub Actions jobs
+
+A coordinator (`bot.py --prepare`) generates the report once, delivers it to
+TELEGRAM_CHAT_ID to obtain the photo file_id, and writes a small report
+artifact. Each shard (`bot.py --shard i/N`) reads the artifact and delivers
+only the groups whose stable chat-id hash falls in shard i, at 1/N of the
+global send rate so all shards together stay within the per-bot limit.
+Subscription changes found by a shard (dead chats, migrations) are written
+to a changes file and merged into the store by `bot.py --apply-changes`.
+"""
+
+import glob
+import hashlib
+import json
+import os
+from image_buffer import ImageBuffer
+
+REPORT_ARTIFACT_DIR = os.environ.get('REPORT_ARTIFACT_DIR', 'report_artifact')
+SHARD_CHANGES_DIR = os.environ.get('SHARD_CHANGES_DIR', 'shard_changes')
+
+ARTIFACT_FILE = "report.json"
+ARTIFACT_IMAGE_FILE = "image.bin"
+
+
+def parse_shard(spec):
+    """
+    Parse an 'i/N' shard spec (0 <= i < N).
+
+    Returns:
+        tuple: (index, count)
+    """
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except (ValueError, AttributeError):
+        raise ValueError(f"Invalid shard '{spec}', expected i/N such as 0/4")
+
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}', need 0 <= i < N")
+    return index, count
+
+
+def shard_of(chat_id, count):
+    """Stable shard number for a chat (same result on every runner)"""
+    digest = hashlib.sha1(str(chat_id).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def select(chat_ids, index, count):
+    """Chat IDs that belong to shard index of count"""
+    return [chat_id for chat_id in chat_ids if shard_of(chat_id, count) == index]
+
+
+# ============================================================================
+# REPORT ARTIFACT
+# ============================================================================
+
+def write_artifact(report, image=None, directory=REPORT_ARTIFACT_DIR):
+    """
+    Write the prepared report for the shards (or staged_report.py).
+    The image (an ImageBuffer) is only included when no Telegram file_id is available.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    image_path = os.path.join(directory, ARTIFACT_IMAGE_FILE)
+    if image and not report.get('file_id'):
+        with open(image_path, 'wb') as f:
+            image.copy_to(f)
+    elif os.path.exists(image_path):
+        os.remove(image_path)
+
+    path = os.path.join(directory, ARTIFACT_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+
+    print(f"📦 Report artifact written to {directory}/")
+    return path
+
+
+def read_artifact(directory=REPORT_ARTIFACT_DIR):
+    """
+    Read the prepared report.
+
+    Returns:
+        dict: The report, with 'image' added (an ImageBuffer, None if not included)
+    """
+    with open(os.path.join(directory, ARTIFACT_FILE), 'r') as f:
+        report = json.load(f)
+
+    image_path = os.path.join(directory, ARTIFACT_IMAGE_FILE)
+    report['image'] = None
+    if os.path.exists(image_path):
+        report['image'] = ImageBuffer.from_file(image_path)
+
+    return report
+
+
+# ============================================================================
+# SUBSCRIPTION CHANGES
+# ============================================================================
+
+def write_changes(index, count, removed, migrated):
+    """Save one shard's subscription changes for the merge step"""
+    os.makedirs(SHARD_CHANGES_DIR, exist_ok=True)
+    path = os.path.join(SHARD_CHANGES_DIR, f"shard-{index}-of-{count}.json")
+    with open(path, 'w') as f:
+        json.dump({'removed': sorted(removed), 'migrated': migrated}, f, indent=2)
+    return path
+
+
+def read_changes():
+    """
+    Merge every shard's changes file.
+
+    Returns:
+        tuple: (set of removed chat IDs, dict of old -> new chat IDs)
+    """
+    removed, migrated = set(), {}
+    for path in sorted(glob.glob(os.path.join(SHARD_CHANGES_DIR, "*.json"))):
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            removed.update(str(chat_id) for chat_id in data.get('removed', []))
+            migrated.update({str(k): str(v) for k, v in data.get('migrated', {}).items()})
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping unreadable changes file {path}: {e}")
+    return removed, migrated
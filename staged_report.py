@@ -0,0 +1,65 @@
+"""
+Staged Report
+Report generated ahead of the send time and released exactly on schedule
+
+`bot.py --stage` does the slow work early: the Perplexity content is
+generated and validated, the image is downloaded and, when
+TELEGRAM_STAGING_CHAT_ID is set, uploaded once to that private chat to obtain
+a reusable photo file_id. `bot.py --release` then waits for REPORT_TIME_UTC
+and only broadcasts, so delivery latency is pure fan-out time.
+"""
+
+import os
+import time
+from datetime import datetime, time as dtime, timezone
+import sharding
+
+STAGED_REPORT_DIR = os.environ.get('STAGED_REPORT_DIR', 'staged_report')
+REPORT_TIME_UTC = os.environ.get('REPORT_TIME_UTC', '17:00')
+
+
+def parse_report_time(value):
+    """Parse an HH:MM string into a UTC time"""
+    try:
+        hour, minute = (int(part) for part in value.split(':'))
+        return dtime(hour, minute, tzinfo=timezone.utc)
+    except ValueError:
+        raise ValueError(f"Invalid REPORT_TIME_UTC '{value}', expected HH:MM")
+
+
+def seconds_until_release(now=None):
+    """Seconds until today's REPORT_TIME_UTC, 0 if it has already passed"""
+    now = now or datetime.now(timezone.utc)
+    release_at = datetime.combine(now.date(), parse_report_time(REPORT_TIME_UTC))
+    return max(0.0, (release_at - now).total_seconds())
+
+
+def wait_for_release():
+    """Sleep until today's REPORT_TIME_UTC"""
+    wait = seconds_until_release()
+    if wait > 0:
+        print(f"⏳ Holding the staged report for {wait / 60:.1f} min until {REPORT_TIME_UTC} UTC")
+        time.sleep(wait)
+
+
+def save(report, image=None):
+    """Stage a report; the image is kept only when no file_id was obtained"""
+    return sharding.write_artifact(report, image=image, directory=STAGED_REPORT_DIR)
+
+
+def load(date):
+    """
+    Load the report staged for date.
+
+    Returns:
+        dict: The staged report with 'image', or None if nothing is staged for date
+    """
+    try:
+        report = sharding.read_artifact(directory=STAGED_REPORT_DIR)
+    except (OSError, ValueError):
+        return None
+
+    if report.get('date') != date:
+        print(f"⚠️ Ignoring staged report from {report.get('date')}")
+        return None
+    return report
@@ -0,0 +1,297 @@
+"""
+Stub Servers
+Local HTTP stand-ins for Perplexity, Pollinations and the Telegram Bot API
+
+One threaded server answers all three services under different path
+prefixes, so bot.py and command_handler.py can run against it unchanged by
+pointing PERPLEXITY_API_URL, IMAGE_API_URL and TELEGRAM_API_BASE_URL at it.
+Each service has its own fault profile (latency, jitter, 5xx rate, 429 rate)
+and the server counts requests, responses and bytes in both directions.
+Used by benchmark.py; nothing here talks to a real service.
+"""
+
+import email
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+PERPLEXITY_PATH = "/perplexity/chat/completions"
+IMAGE_PATH = "/pollinations/prompt/"
+TELEGRAM_PATH = "/telegram"
+
+SAMPLE_REPORT = (
+    "📊 *Crypto Market Daily*\n\n"
+    "*Bitcoin* holds above key support as spot ETF inflows continue.\n\n"
+    "• *BTC*: +2.1% on the day, volume up 14%\n"
+    "• *ETH*: +1.4%, staking deposits at a monthly high\n"
+    "• *SOL*: -0.8% after a strong week\n\n"
+    "_Macro_: markets price in a steady rate path ahead of CPI.\n\n"
+    "#CryptoNews #MarketOverview"
+)
+
+
+class FaultProfile:
+    """How a stubbed service misbehaves"""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1):
+        self.latency = latency            # seconds added to every response
+        self.jitter = jitter              # +/- fraction of latency
+        self.error_rate = error_rate      # share of requests answered with 500
+        self.rate_limit_rate = rate_limit_rate  # share of requests answered with 429
+        self.retry_after = retry_after    # seconds advertised on 429
+
+    def delay(self):
+        if self.latency > 0:
+            spread = self.latency * self.jitter
+            time.sleep(max(0.0, random.uniform(self.latency - spread, self.latency + spread)))
+
+    def outcome(self):
+        """'ok', 'error' or 'rate_limited' for one request"""
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return 'rate_limited'
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+
+class ServiceStats:
+    """Request and byte counters for one stubbed service"""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.statuses = {}
+        self.methods = {}
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'statuses': dict(self.statuses),
+            'methods': dict(self.methods),
+        }
+
+
+def parse_form(content_type, body):
+    """Decode a JSON, urlencoded or multipart request body into a flat dict"""
+    if not body:
+        return {}
+    if 'json' in content_type:
+        try:
+            return json.loads(body)
+        except ValueError:
+            return {}
+    if 'multipart' in content_type:
+        message = email.message_from_bytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        fields = {}
+        for part in message.get_payload():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename():
+                fields[name] = b''
+            else:
+                fields[name] = part.get_payload(decode=True).decode('utf-8', 'replace')
+        return fields
+    return {key: values[0] for key, values in parse_qs(body.decode('utf-8', 'replace')).items()}
+
+
+class StubServers:
+    """
+    The stand-in server.
+
+    Usage:
+        stubs = StubServers(telegram=FaultProfile(latency=0.05)).start()
+        stubs.env()  # environment variables pointing bot.py at the stubs
+        stubs.stop()
+    """
+
+    def __init__(self, perplexity=None, image=None, telegram=None, image_size=150_000, report_text=SAMPLE_REPORT):
+        self.profiles = {
+            'perplexity': perplexity or FaultProfile(),
+            'image': image or FaultProfile(),
+            'telegram': telegram or FaultProfile(),
+        }
+        self.image_bytes = b"\xff\xd8\xff\xe0" + random.randbytes(max(0, image_size - 4))
+        self.report_text = report_text
+        self.updates = []
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self.stats = {name: ServiceStats() for name in self.profiles}
+        self._server = None
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self, host="127.0.0.1", port=0):
+        stubs = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stubs._handle(self)
+
+            def do_POST(self):
+                stubs._handle(self)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self):
+        """Environment overrides that point bot.py and command_handler.py at the stubs"""
+        return {
+            'PERPLEXITY_API_URL': self.base_url + PERPLEXITY_PATH,
+            'IMAGE_API_URL': self.base_url + IMAGE_PATH,
+            'TELEGRAM_API_BASE_URL': self.base_url + TELEGRAM_PATH,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {name: ServiceStats() for name in self.profiles}
+
+    def stats_dict(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self.stats.items()}
+
+    # ------------------------------------------------------------------
+    # Request handling
+    # ------------------------------------------------------------------
+
+    def _handle(self, request):
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+
+        if request.path.startswith(PERPLEXITY_PATH):
+            service = 'perplexity'
+        elif request.path.startswith(IMAGE_PATH):
+            service = 'image'
+        elif request.path.startswith(TELEGRAM_PATH):
+            service = 'telegram'
+        else:
+            self._respond(request, None, 404, b'not found', 'text/plain', len(body))
+            return
+
+        profile = self.profiles[service]
+        profile.delay()
+        outcome = profile.outcome()
+        data = parse_form(request.headers.get('Content-Type', ''), body)
+
+        if service == 'perplexity':
+            status, payload, content_type = self._perplexity(outcome, data, profile)
+        elif service == 'image':
+            status, payload, content_type = self._image(outcome)
+        else:
+            method = request.path.rsplit('/', 1)[-1]
+            with self._lock:
+                self.stats[service].methods[method] = self.stats[service].methods.get(method, 0) + 1
+            status, payload, content_type = self._telegram(outcome, method, data, profile)
+
+        extra = {'Retry-After': str(profile.retry_after)} if status == 429 else None
+        self._respond(request, service, status, payload, content_type, len(body), extra)
+
+    def _respond(self, request, service, status, payload, content_type, bytes_in, headers=None):
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(payload)
+
+        if service is not None:
+            with self._lock:
+                stats = self.stats[service]
+                stats.requests += 1
+                stats.bytes_in += bytes_in
+                stats.bytes_out += len(payload)
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def _perplexity(self, outcome, data, profile):
+        if outcome == 'rate_limited':
+            return 429, b'{"error": "rate limited"}', 'application/json'
+        if outcome == 'error':
+            return 500, b'{"error": "upstream error"}', 'application/json'
+
+        if data.get('stream'):
+            events = []
+            for start in range(0, len(self.report_text), 40):
+                chunk = {'choices': [{'delta': {'content': self.report_text[start:start + 40]}}]}
+                events.append(f"data: {json.dumps(chunk)}\n\n")
+            events.append("data: [DONE]\n\n")
+            return 200, "".join(events).encode('utf-8'), 'text/event-stream'
+
+        response = {'choices': [{'message': {'role': 'assistant', 'content': self.report_text}}]}
+        return 200, json.dumps(response).encode('utf-8'), 'application/json'
+
+    def _image(self, outcome):
+        if outcome == 'rate_limited':
+            return 429, b'rate limited', 'text/plain'
+        if outcome == 'error':
+            return 500, b'upstream error', 'text/plain'
+        return 200, self.image_bytes, 'image/jpeg'
+
+    def _telegram(self, outcome, method, data, profile):
+        if outcome == 'rate_limited':
+            result = {
+                'ok': False, 'error_code': 429,
+                'description': f"Too Many Requests: retry after {profile.retry_after}",
+                'parameters': {'retry_after': profile.retry_after},
+            }
+            return 429, json.dumps(result).encode('utf-8'), 'application/json'
+        if outcome == 'error':
+            result = {'ok': False, 'error_code': 500, 'description': "Internal Server Error"}
+            return 500, json.dumps(result).encode('utf-8'), 'application/json'
+
+        result = self._telegram_result(method, data)
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8'), 'application/json'
+
+    def _telegram_result(self, method, data):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Stub', 'username': 'stub_bot'}
+        if method == 'getUpdates':
+            with self._lock:
+                offset = int(data.get('offset') or 0)
+                self.updates = [update for update in self.updates if update['update_id'] >= offset]
+                return self.updates[:int(data.get('limit') or 100)]
+        if method in ('sendMessage', 'sendPhoto'):
+            with self._lock:
+                self._message_id += 1
+                message_id = self._message_id
+            chat_id = str(data.get('chat_id', '0'))
+            message = {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(chat_id) if chat_id.lstrip('-').isdigit() else 0, 'type': 'group', 'title': 'Stub'},
+            }
+            if method == 'sendPhoto':
+                message['photo'] = [
+                    {'file_id': 'stub-photo-small', 'file_unique_id': 's', 'width': 90, 'height': 90},
+                    {'file_id': 'stub-photo', 'file_unique_id': 'l', 'width': 1024, 'height': 1024},
+                ]
+                message['caption'] = data.get('caption', '')
+            else:
+                message['text'] = data.get('text', '')
+            return message
+        return True
@@ -0,0 +1,138 @@
+"""
+HTTP Transport
+Shared, pooled requests sessions for Perplexity, Pollinations and Telegram
+
+Every host gets its own keep-alive session, so retries and broadcast sends
+reuse open TCP+TLS connections instead of handshaking on every request.
+"""
+
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Connections kept open per host; should be at least BROADCAST_MAX_WORKERS
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '32'))
+# Seconds allowed to establish a connection (read timeouts are set per call)
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '10'))
+# Read timeout used when a caller does not pass one
+HTTP_DEFAULT_TIMEOUT = float(os.environ.get('HTTP_DEFAULT_TIMEOUT', '60'))
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def _host_key(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _new_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session(url):
+    """Get the shared session for the host of url, creating it on first use"""
+    key = _host_key(url)
+
+    with _lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _new_session()
+            _sessions[key] = session
+        return session
+
+
+def _timeout(timeout):
+    """Turn a read timeout into a (connect, read) tuple"""
+    if timeout is None:
+        timeout = HTTP_DEFAULT_TIMEOUT
+    if isinstance(timeout, tuple):
+        return timeout
+    return (min(HTTP_CONNECT_TIMEOUT, timeout), timeout)
+
+
+def _body_size(body):
+    # bytes, str and streamed bodies such as image_buffer.MultipartBody
+    return len(body) if hasattr(body, '__len__') else 0
+
+
+def request(method, url, timeout=None, **kwargs):
+    """
+    Send a request through the pooled session for the url's host.
+    Timing, status and byte counts are recorded in metrics per host.
+    """
+    host = urlsplit(url).netloc
+    started = time.perf_counter()
+    try:
+        response = get_session(url).request(method, url, timeout=_timeout(timeout), **kwargs)
+    except requests.exceptions.RequestException as e:
+        metrics.observe('http_request_seconds', time.perf_counter() - started, host=host)
+        metrics.inc('http_responses_total', host=host, status=type(e).__name__)
+        raise
+
+    metrics.observe('http_request_seconds', time.perf_counter() - started, host=host)
+    metrics.inc('http_responses_total', host=host, status=response.status_code)
+    metrics.inc('http_bytes_sent_total', _body_size(response.request.body), host=host)
+    if kwargs.get('stream'):
+        # The body is still on the wire; count what the server announced
+        received = int(response.headers.get('Content-Length') or 0)
+    else:
+        received = len(response.content)
+    metrics.inc('http_bytes_received_total', received, host=host)
+    return response
+
+
+def get(url, timeout=None, **kwargs):
+    """Pooled equivalent of requests.get"""
+    return request("GET", url, timeout=timeout, **kwargs)
+
+
+def post(url, timeout=None, **kwargs):
+    """Pooled equivalent of requests.post"""
+    return request("POST", url, timeout=timeout, **kwargs)
+
+
+def _socket(response):
+    """The socket under a streamed response (None if it cannot be reached)"""
+    sock = getattr(response.raw.connection, 'sock', None)
+    if sock is None:
+        # http.client drops conn.sock for Connection: close responses;
+        # the body is then read through the response's own socket file
+        fp = getattr(getattr(response.raw, '_fp', None), 'fp', None)
+        sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+    return sock
+
+
+def abort(response):
+    """
+    Abort a streamed response from another thread.
+    Closing it would wait for the reader's lock, so the socket is shut down
+    instead and a read blocked on it returns at once.
+    """
+    sock = _socket(response)
+    if sock is None:
+        response.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def close_all():
+    """Close every pooled session (safe to call more than once)"""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,101 @@
+"""
+Update Offset Checkpoint
+Remembers the last Telegram update the command handler finished processing
+
+The id is kept in memory as updates complete and written to
+UPDATE_OFFSET_FILE at most every UPDATE_OFFSET_FLUSH_SECONDS (and on
+shutdown), so a restarted handler resumes after the last answered update
+instead of replying to it twice. Telegram picks a random update id after a
+week without updates, so older checkpoints are ignored.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+UPDATE_OFFSET_FILE = os.environ.get('UPDATE_OFFSET_FILE', 'update_offset.json')
+UPDATE_OFFSET_FLUSH_SECONDS = float(os.environ.get('UPDATE_OFFSET_FLUSH_SECONDS', '5'))
+
+# Telegram only keeps update ids sequential while updates keep arriving
+MAX_CHECKPOINT_AGE = 6 * 24 * 3600
+
+_lock = threading.Lock()
+_last_update_id = None
+_flushed_update_id = None
+_last_flush = 0.0
+
+
+def load():
+    """
+    Read the checkpoint from disk.
+
+    Returns:
+        int: Last processed update id, or None if there is no usable checkpoint
+    """
+    global _last_update_id, _flushed_update_id
+
+    try:
+        with open(UPDATE_OFFSET_FILE, 'r') as f:
+            data = json.load(f)
+        last_update_id = int(data['last_update_id'])
+        saved_at = float(data.get('saved_at', 0))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        print(f"⚠️ Ignoring unreadable update offset: {e}")
+        return None
+
+    if time.time() - saved_at > MAX_CHECKPOINT_AGE:
+        print("ℹ️ Update offset checkpoint is too old, ignoring it")
+        return None
+
+    with _lock:
+        _last_update_id = _flushed_update_id = last_update_id
+    return last_update_id
+
+
+def last_update_id():
+    """Highest update id processed so far (None if unknown)"""
+    with _lock:
+        return _last_update_id
+
+
+def mark_processed(update_id):
+    """Record that an update has been handled"""
+    global _last_update_id
+    with _lock:
+        if _last_update_id is None or update_id > _last_update_id:
+            _last_update_id = update_id
+
+
+def flush(force=False):
+    """
+    Write the checkpoint if it changed and the flush interval has passed.
+
+    Returns:
+        bool: True if the file was written
+    """
+    global _flushed_update_id, _last_flush
+
+    with _lock:
+        if _last_update_id is None or _last_update_id == _flushed_update_id:
+            return False
+        if not force and time.monotonic() - _last_flush < UPDATE_OFFSET_FLUSH_SECONDS:
+            return False
+
+        data = {'last_update_id': _last_update_id, 'saved_at': time.time()}
+        directory = os.path.dirname(os.path.abspath(UPDATE_OFFSET_FILE))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".update_offset.", suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, UPDATE_OFFSET_FILE)
+        except OSError as e:
+            print(f"⚠️ Could not save update offset: {e}")
+            return False
+
+        _flushed_update_id = _last_update_id
+        _last_flush = time.monotonic()
+        return True